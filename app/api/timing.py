@@ -1,13 +1,135 @@
 # app/api/timing.py
-from fastapi import APIRouter, UploadFile, File
-from app.detection.multi_detector import process_video_with_timing
+import asyncio
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, UploadFile, File, Query, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
+from app.detection.result_cache import result_cache
+
 router = APIRouter()
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 上传按 1MB 分块落盘，不把整个视频读入内存
+MAX_TIMING_JOBS = 50  # 最多保留的任务记录数，超出时丢弃最早完成的任务
+
+# 计时任务在单独的线程中串行执行，不阻塞事件循环，多个大视频也不会互相争抢 CPU
+timing_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timing")
+TIMING_JOBS = OrderedDict()  # job_id -> 任务状态
+timing_jobs_lock = threading.Lock()
+
+
+async def save_upload(file: UploadFile):
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    tmp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_in_threadpool(tmp_file.write, chunk)
+    except Exception:
+        tmp_file.close()
+        os.remove(tmp_file.name)
+        raise
+    tmp_file.close()
+    return tmp_file.name
+
+
+# 计时结果反映的是本次运行时的负载和环境，每次都重新测量，不使用结果缓存
+def run_timing_job(job, video_path, iterations, warmup):
+    from app.detection.benchmark import run_benchmark
+
+    def progress(processed, total):
+        job["processed"] = processed
+        job["total"] = total
+
+    job["status"] = "running"
+    try:
+        job["result"] = run_benchmark(video_path, iterations=iterations, warmup_frames=warmup, progress=progress)
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        os.remove(video_path)
+
+
+def add_job(job_id, job):
+    with timing_jobs_lock:
+        TIMING_JOBS[job_id] = job
+        finished = [key for key, value in TIMING_JOBS.items() if value["status"] in ("done", "failed")]
+        for key in finished[:max(0, len(TIMING_JOBS) - MAX_TIMING_JOBS)]:
+            del TIMING_JOBS[key]
+
 
+def job_view(job_id, job):
+    total = job["total"]
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "processed": job["processed"],
+        "total": total,
+        "progress": round(min(1.0, job["processed"] / total), 4) if total else None,
+        "error": job["error"],
+        "result": job["result"],
+    }
+
+
+# 上传视频后在后台逐阶段计时，立即返回任务 ID，通过 /timing/jobs/{job_id} 查询进度和结果；
+# wait=true 时等待分析完成再返回（等待期间不占用事件循环）
 @router.post("/timing")
-async def run_timing_test(file: UploadFile = File(...)):
-    contents = await file.read()
-    result = process_video_with_timing(contents)
+async def run_timing_test(file: UploadFile = File(...),
+                          iterations: int = Query(1, ge=1, le=20, description="整段视频重复处理次数"),
+                          warmup: int = Query(0, ge=0, description="不计入统计的预热帧数"),
+                          wait: bool = Query(False, description="是否等待分析完成")):
+    video_path = await save_upload(file)
+    job_id = uuid.uuid4().hex
+    job = {"status": "queued", "processed": 0, "total": 0, "error": None, "result": None}
+    add_job(job_id, job)
+    future = timing_executor.submit(run_timing_job, job, video_path, iterations, warmup)
+
+    if wait:
+        await asyncio.wrap_future(future)
+        status_code = 400 if job["status"] == "failed" else 200
+        return JSONResponse(status_code=status_code, content=job_view(job_id, job))
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status_url": f"/timing/jobs/{job_id}"})
+
+
+@router.get("/jobs/{job_id}")
+def get_timing_job(job_id: str):
+    with timing_jobs_lock:
+        job = TIMING_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_view(job_id, job)
+
+
+# 使用合成视频跑基准测试，便于不同版本之间对比
+@router.get("/benchmark")
+async def run_synthetic_benchmark(frames: int = Query(100, ge=10, le=2000),
+                                  width: int = Query(640, ge=64, le=3840),
+                                  height: int = Query(480, ge=64, le=2160),
+                                  iterations: int = Query(3, ge=1, le=20)):
+    from app.detection.benchmark import run_benchmark
+    future = timing_executor.submit(run_benchmark, frames=frames, size=(width, height), iterations=iterations)
+    result = await asyncio.wrap_future(future)
     return JSONResponse(content=result)
+
+
+# 分析结果缓存在磁盘上的条目数与占用
+@router.get("/cache")
+def cache_report():
+    return result_cache.report()
+
+
+# 已加载模型的加载 / 预热耗时与内存占用
+@router.get("/models")
+def model_report():
+    from app.detection.model_registry import registry
+    return registry.report()
@@ -1,28 +1,96 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from app.utils.database import get_db
 from app.models import Device
-from app.detection.multi_detector import MultiDetector
-from app.utils.video_utils import get_video_capture, read_frame
+from app.utils.video_utils import get_video_capture, FrameSampler, LatestFrameReader
+from app.utils.json_utils import json_default
+import asyncio
+import concurrent.futures
+import functools
+import json
 import time
 import os
 import threading
 
 from app.schemas import NotificationCreate
-from app.crud import create_notification
-from app.api.websocket import send_alert_message  # ✅ 新增
+from app.api.websocket import alert_bridge
 from app.utils.security import get_current_user  # ✅ 引入当前用户依赖
 from app.models import User
+from app.config import (INFERENCE_WORKERS, INFERENCE_TORCH_THREADS, INFERENCE_SHARED_MEMORY, INFERENCE_TIMEOUT,
+                        MOTION_GATE_ENABLED, MOTION_GATE_MAX_INTERVAL,
+                        NOTIFICATION_QUEUE_SIZE, NOTIFICATION_BATCH_SIZE, NOTIFICATION_FLUSH_INTERVAL)
+from app.detection.inference_pool import InferencePool
+from app.utils.notification_writer import NotificationWriter
 
 router = APIRouter()
-multi_detector = MultiDetector()
+
+# 推理进程池，INFERENCE_WORKERS > 0 时在首次启动持续检测时创建
+inference_pool = None
+inference_pool_lock = threading.Lock()
+# 检测告警的批量入库服务，首次需要写通知时启动
+notification_writer = None
+notification_writer_lock = threading.Lock()
 
 # 冷却时间（秒）
 COOL_DOWN_TIME = 5  # 每5秒内同一通知不重复发送
 DETECTION_THREADS = {}
+CAPTURE_READERS = {}  # device_id -> LatestFrameReader
 STOP_FLAGS = {}
 
 
+# 检测栈（torch / ultralytics / mediapipe）在首次检测时才导入并加载模型，导入本模块本身很轻
+def get_multi_detector():
+    from app.detection.multi_detector import get_shared_detector
+    return get_shared_detector()
+
+
+def get_inference_pool():
+    global inference_pool
+    with inference_pool_lock:
+        if inference_pool is None:
+            inference_pool = InferencePool(num_workers=INFERENCE_WORKERS,
+                                           torch_threads=INFERENCE_TORCH_THREADS,
+                                           shared_memory=INFERENCE_SHARED_MEMORY).start()
+    return inference_pool
+
+
+def shutdown_inference_pool():
+    global inference_pool
+    with inference_pool_lock:
+        if inference_pool is not None:
+            inference_pool.shutdown()
+            inference_pool = None
+
+
+def get_notification_writer():
+    global notification_writer
+    with notification_writer_lock:
+        if notification_writer is None:
+            notification_writer = NotificationWriter(max_queue=NOTIFICATION_QUEUE_SIZE,
+                                                     batch_size=NOTIFICATION_BATCH_SIZE,
+                                                     flush_interval=NOTIFICATION_FLUSH_INTERVAL).start()
+    return notification_writer
+
+
+def shutdown_notification_writer():
+    global notification_writer
+    with notification_writer_lock:
+        if notification_writer is not None:
+            notification_writer.shutdown()
+            notification_writer = None
+
+
+# 通知入库后在写入线程中回调，推送消息带上数据库生成的 ID，经 alert_bridge 交给事件循环推送
+def push_alert(level, message, future):
+    if future.exception() is not None:
+        print(f"❌ 通知写入失败: {future.exception()}")
+        return
+    notification = future.result()
+    alert_bridge.publish(level, message, notification["id"], device_id=notification["device_id"])
+
+
 # 启动持续检测
 @router.post("/start-detect")
 def start_detect(
@@ -39,19 +107,51 @@ def start_detect(
 
     stop_flag = threading.Event()
     STOP_FLAGS[device_id] = stop_flag
+    # 请求的 db 会话在请求结束后关闭，检测线程中的通知交给 NotificationWriter 用它自己的会话写入
+    user_id = current_user.id
+    writer = get_notification_writer()
+    from app.detection.frame_packet import FramePacket
+    from app.detection.motion_gate import MotionGate
+
+    pool = get_inference_pool() if INFERENCE_WORKERS > 0 else None
+    multi_detector = get_multi_detector() if pool is None else None
+    # 每路流独立的检测状态；使用进程池时由推理进程按 device_id 维护
+    context = multi_detector.create_context(device_id) if pool is None else None
+
+    def run_detection(packet):
+        if pool is not None:
+            # 推理放到独立进程中执行，不占用 API 进程的 GIL；超时按该帧检测失败处理，检测线程不会永远阻塞
+            return pool.detect(device_id, packet.frame, timeout=INFERENCE_TIMEOUT)
+        return multi_detector.detect(packet, context=context)
 
     def detection_loop():
-        cap = get_video_capture(device.rtsp_url)
+        # 独立采集线程持续拉流，检测时总是取最新一帧
+        cap = LatestFrameReader(device.rtsp_url).start()
+        CAPTURE_READERS[device_id] = cap
         notified_messages = {}
+        packet = FramePacket()
+        # 每路流独立的运动门控，静止画面跳过推理
+        gate = MotionGate(max_interval=MOTION_GATE_MAX_INTERVAL) if MOTION_GATE_ENABLED else None
+        # 每路流独立的抽帧调度器，采样率随检测等级自适应
+        sampler = FrameSampler()
 
         while not stop_flag.is_set():
-            frame = read_frame(cap)
+            frame = sampler.read(cap, stop_flag)
             if frame is None:
                 continue
 
-            detection = multi_detector.detect(frame)
+            packet.load(frame)
+            try:
+                if gate is not None:
+                    detection = gate.run(run_detection, packet, now=cap.last_timestamp)
+                else:
+                    detection = run_detection(packet)
+            except Exception as e:
+                print(f"❌ 检测失败: {e}")
+                continue
 
             if isinstance(detection, dict):
+                sampler.update(detection.get("overall_level", "safe"))
                 causes = detection.get("causes", [])
                 for cause in causes:
                     level = cause.get("level")
@@ -66,23 +166,17 @@ def start_detect(
                                 level=level,
                                 message=message
                             )
-                            notification = create_notification(db, notification_data, user_id=current_user.id)
-
-                            try:
-                                import asyncio
-                                asyncio.run(send_alert_message(level=level, message=message, alert_id=notification.id))
-                            except RuntimeError:
-                                loop = asyncio.new_event_loop()
-                                asyncio.set_event_loop(loop)
-                                loop.run_until_complete(
-                                    send_alert_message(level=level, message=message, alert_id=notification.id))
-                                loop.close()
+                            writer.submit(notification_data, user_id).add_done_callback(
+                                functools.partial(push_alert, level, message))
 
                             notified_messages[message] = current_time
 
-            time.sleep(0.1)
-
         cap.release()
+        CAPTURE_READERS.pop(device_id, None)
+        if context is not None:
+            context.close()
+        elif pool is not None:
+            pool.release_stream(device_id)
 
     t = threading.Thread(target=detection_loop, daemon=True)
     DETECTION_THREADS[device_id] = t
@@ -108,9 +202,33 @@ def stop_detect(
     return {"message": f"已停止设备 {device_id} 的检测"}
 
 
-# 没有用的接口，还不知道怎么用
+# 各路流采集线程的统计：采集 / 送检 / 丢弃帧数与重连次数
+@router.get("/capture-stats")
+def capture_stats():
+    return {device_id: dict(reader.stats) for device_id, reader in CAPTURE_READERS.items()}
+
+
+# 通知批量写入服务状态：队列深度、写入条数 / 批数、写入耗时
+@router.get("/notification-writer")
+def notification_writer_stats():
+    if notification_writer is None:
+        return {"started": False}
+    return {"started": True, **notification_writer.stats()}
+
+
+# 推理进程池状态
+@router.get("/inference-pool")
+def inference_pool_stats():
+    if inference_pool is None:
+        return {"enabled": INFERENCE_WORKERS > 0, "started": False}
+    return {"enabled": True, "started": True, **inference_pool.stats()}
+
+
+# 检测接口：支持本地视频或设备 ID 对应的 RTSP 流，结果以 NDJSON 流式返回。
+# 检测在独立线程中进行，每算完一帧立即推送一行，不阻塞事件循环；
+# 每行为 {"type": "start" | "frame" | "end" | "error", ...}
 @router.get("/detect")
-async def detect_video_source(
+def detect_video_source(
         device_id: int = Query(None, description="设备 ID（用于从数据库获取 RTSP 地址）"),
         video_path: str = Query(None, description="本地测试视频路径（如传入则优先使用）"),
         max_frames: int = Query(10, description="最多处理多少帧"),
@@ -118,15 +236,11 @@ async def detect_video_source(
         current_user: User = Depends(get_current_user)  # ✅ 获取当前登录用户
 ):
 
-    # 检测接口：支持本地视频或设备 ID 对应的 RTSP 流。
     # 优先使用本地视频路径，如未提供则使用数据库中设备的 RTSP 地址。
-
-    # 优先使用本地视频路径
     if video_path:
         if not os.path.exists(video_path):
             raise HTTPException(status_code=400, detail="本地视频文件不存在")
 
-        cap = get_video_capture(video_path)
         source_info = video_path  # 视频路径作为源信息
         device_name = "LocalTest"
         device_id = None  # 本地视频测试时没有设备 ID，设为 None
@@ -137,76 +251,117 @@ async def detect_video_source(
         if not device.rtsp_url:
             raise HTTPException(status_code=400, detail="设备未配置 RTSP 流地址")
 
-        cap = get_video_capture(device.rtsp_url)
         source_info = device.rtsp_url
         device_name = device.name
 
     else:
         raise HTTPException(status_code=400, detail="请提供 device_id 或 video_path")
 
-    # 帧检测循环
-    results = []
-    count = 0
-    notified_messages = {}  # 用于记录已经通知的 (frame_index, message) 和通知时间
-
-    while count < max_frames:
-        frame = read_frame(cap)
-        if frame is None:
-            break
-
-        # 执行检测
-        detection = multi_detector.detect(frame)
-
-        # 遍历检测结果并根据危险级别创建通知 + 推送
-        if isinstance(detection, dict):  # ensure detection is valid
-            overall_level = detection.get("overall_level")
-            causes = detection.get("causes", [])
-
-            for cause in causes:
-                level = cause.get("level")  # 修改为 level
-                message = cause.get("reason")  # 修改为 message
-
-                # 只处理 level 为 'warning' 或 'danger' 的情况
-                if level in ['warning', 'danger']:
-                    current_time = time.time()
-                    # 检查是否已经通知过该消息，且冷却时间是否到
-                    if message not in notified_messages or current_time - notified_messages[message] >= COOL_DOWN_TIME:
-                        if level and message:
-                            # 本地视频测试时 device_id 传入 None 或虚拟 ID
-                            notification_data = NotificationCreate(
-                                device_id=device_id or 1,  # 本地视频时传入 1 或其他虚拟值
-                                level=level,
-                                message=message
-                            )
+    try:
+        cap = get_video_capture(source_info)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 请求的 db 会话在响应开始后即被关闭，检测线程中的通知交给 NotificationWriter 写入
+    user_id = current_user.id
+    header = {"type": "start", "device_name": device_name, "video_source": source_info}
+    capture_taken = threading.Event()
+    # 客户端在响应开始前断开时生成器不会执行，由后台任务兜底释放采集
+    return StreamingResponse(stream_detection(cap, device_id, user_id, max_frames, header, capture_taken),
+                             media_type="application/x-ndjson",
+                             background=BackgroundTask(release_unused_capture, cap, capture_taken))
+
+
+def release_unused_capture(cap, capture_taken):
+    # 检测线程未启动时采集无人释放，在这里释放，避免残留 ffmpeg 子进程占用摄像头连接；
+    # 检测线程启动后由它负责释放
+    if not capture_taken.is_set():
+        capture_taken.set()
+        cap.release()
 
-                            notification = create_notification(
-                                db, notification_data,
-                                user_id=current_user.id  # 只传 user_id, 因为 level 和 message 已经在 NotificationCreate 中
-                            )
 
-                            # ✅ 异步推送 WebSocket 通知
-                            await send_alert_message(  # 使用 await
-                                level=level,  # 修改为 level
-                                message=message,  # 修改为 message
-                                alert_id=notification.id
-                            )
+def to_ndjson(item):
+    return json.dumps(item, ensure_ascii=False, default=json_default) + "\n"
 
-                            # 更新通知时间
-                            notified_messages[message] = current_time
 
-        results.append({
-            "frame_index": count,
-            "detection": detection
-        })
+async def stream_detection(cap, device_id, user_id, max_frames, header, capture_taken):
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue(maxsize=8)  # 客户端读取慢时检测线程在这里等待
+    stop_flag = threading.Event()
 
-        count += 1
-        time.sleep(0.1)
+    def emit(item):
+        future = asyncio.run_coroutine_threadsafe(results.put(item), loop)
+        while not stop_flag.is_set():
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                continue
+        future.cancel()
+
+    def detection_worker():
+        writer = get_notification_writer()
+        notified_messages = {}  # 用于记录已经通知的 message 和通知时间
+        sampler = FrameSampler(safe_fps=5.0, warning_fps=5.0, danger_fps=5.0)
+        count = 0
+        context = None
+        try:
+            multi_detector = get_multi_detector()
+            context = multi_detector.create_context(device_id)
+            while count < max_frames and not stop_flag.is_set():
+                frame = sampler.read(cap, stop_flag)
+                if frame is None:
+                    break
+
+                # 执行检测
+                detection = multi_detector.detect(frame, context=context)
+
+                # 遍历检测结果并根据危险级别创建通知 + 推送
+                for cause in detection.get("causes", []):
+                    level = cause.get("level")
+                    message = cause.get("reason")
+
+                    # 只处理 level 为 'warning' 或 'danger' 的情况，冷却时间内不重复通知
+                    if level in ['warning', 'danger'] and message:
+                        current_time = time.time()
+                        if message not in notified_messages or current_time - notified_messages[message] >= COOL_DOWN_TIME:
+                            # 本地视频测试时 device_id 传入 1 作为虚拟值
+                            notification_data = NotificationCreate(
+                                device_id=device_id or 1,
+                                level=level,
+                                message=message
+                            )
+                            # ✅ 入库和推送都不阻塞检测线程
+                            writer.submit(notification_data, user_id).add_done_callback(
+                                functools.partial(push_alert, level, message))
 
-    cap.release()
+                            notified_messages[message] = current_time
 
-    return {
-        "device_name": device_name,
-        "video_source": source_info,
-        "frames_processed": count,
-        "results": results
-    }
+                emit({"type": "frame", "frame_index": count, "detection": detection})
+                count += 1
+
+            emit({"type": "end", "frames_processed": count})
+        except Exception as e:
+            print(f"❌ 检测失败: {e}")
+            emit({"type": "error", "frames_processed": count, "error": str(e)})
+        finally:
+            cap.release()
+            if context is not None:
+                context.close()
+            emit(None)
+
+    try:
+        yield to_ndjson(header)
+        if capture_taken.is_set():
+            return
+        capture_taken.set()
+        threading.Thread(target=detection_worker, name="video-detect-stream", daemon=True).start()
+        while True:
+            item = await results.get()
+            if item is None:
+                break
+            yield to_ndjson(item)
+    finally:
+        # 客户端断开时通知检测线程停止；在发出首行时断开则检测线程未启动，直接释放采集
+        stop_flag.set()
+        release_unused_capture(cap, capture_taken)
@@ -1,45 +1,255 @@
 from fastapi import WebSocket, WebSocketDisconnect, APIRouter
-from typing import List
+from typing import Dict, List
+from collections import deque
+import asyncio
 import json
+import time
+
+from app.config import ALERT_BRIDGE_QUEUE_SIZE, WS_SEND_QUEUE_SIZE, WS_OVERFLOW_POLICY
 router = APIRouter()
 
-connected_clients: List[WebSocket] = []
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect")
+if WS_OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+    raise ValueError(f"未知的 WS_OVERFLOW_POLICY: {WS_OVERFLOW_POLICY}，可选值: {', '.join(OVERFLOW_POLICIES)}")
+
+
+class ClientConnection:
+    # 每个 WebSocket 连接一个有界发送队列和一个发送任务，广播只入队不等待网络 I/O，
+    # 慢客户端只会让自己的队列变长，不影响其他连接；队列满时按 policy 处理：
+    #   drop_oldest - 丢弃该连接最旧的待发消息（降级：慢客户端只收到较新的告警）
+    #   disconnect  - 断开该连接，由客户端重连后重新拉取通知列表
+    def __init__(self, websocket, max_queue=WS_SEND_QUEUE_SIZE, policy=WS_OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.task = None
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.last_lag = 0.0  # 最近一条消息从入队到发送完成的耗时（秒）
+        self.max_lag = 0.0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._send_loop())
+        return self
+
+    # 入队一条消息，返回 False 表示按 disconnect 策略应断开该连接
+    def offer(self, payload, enqueued_at):
+        if self.queue.full():
+            if self.policy == "disconnect":
+                return False
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((payload, enqueued_at))
+        return True
+
+    async def _send_loop(self):
+        while True:
+            payload, enqueued_at = await self.queue.get()
+            try:
+                await self.websocket.send_text(payload)
+            except Exception as e:
+                print(f"❌ WebSocket 推送失败: {e}")
+                unregister_client(self.websocket, cancel=False)
+                return
+            self.sent += 1
+            self.last_lag = time.perf_counter() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+
+connected_clients: Dict[WebSocket, ClientConnection] = {}
+slow_disconnects = 0  # 因发送队列溢出被断开的连接数
+
+
+def register_client(websocket, **kwargs):
+    client = ClientConnection(websocket, **kwargs).start()
+    connected_clients[websocket] = client
+    return client
+
+
+def unregister_client(websocket, cancel=True):
+    client = connected_clients.pop(websocket, None)
+    if client is not None and cancel:
+        client.close()
+    return client
+
+
+async def close_slow_client(websocket):
+    try:
+        await websocket.close(code=1013)  # 1013: Try Again Later
+    except Exception:
+        pass
 
 
 @router.websocket("/alerts")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    connected_clients.append(websocket)
+    register_client(websocket)
     print("🟢 新客户端连接 WebSocket")
     try:
         while True:
             await websocket.receive_text()  # 保持连接活跃
     except WebSocketDisconnect:
-        connected_clients.remove(websocket)
         print("🔌 客户端断开 WebSocket")
+    finally:
+        unregister_client(websocket)
+
+
+# 把一条消息放入所有连接的发送队列，不等待任何 I/O；须在事件循环中调用
+def broadcast(payload):
+    global slow_disconnects
+    enqueued_at = time.perf_counter()
+    overflowed = [websocket for websocket, client in connected_clients.items()
+                  if not client.offer(payload, enqueued_at)]
+    for websocket in overflowed:
+        unregister_client(websocket)
+        slow_disconnects += 1
+        asyncio.get_running_loop().create_task(close_slow_client(websocket))
+    if overflowed:
+        print(f"🔌 {len(overflowed)} 个客户端发送队列溢出，已断开")
 
 
-# 推送函数，供外部调用
-async def send_alert_message(level: str, message: str, alert_id: int = 1):
+# 推送函数，供外部调用；消息只进入各连接的发送队列，由各自的发送任务并发发送；
+# alert_ids 为合并推送时本条消息对应的全部通知 ID（alert_id 为其中最新的一条）
+async def send_alert_message(level: str, message: str, alert_id: int = 1, device_id: int = None,
+                             alert_ids: List[int] = None):
     data = {
         "id": alert_id,
         "level": level,
-        "message": message
+        "message": message,
+        "device_id": device_id,
     }
+    if alert_ids and len(alert_ids) > 1:
+        data["ids"] = alert_ids
     json_data = json.dumps(data)
 
     print(f"📡 推送消息给 {len(connected_clients)} 个客户端: {json_data}")
+    broadcast(json_data)
 
-    # 使用 list 来遍历客户端连接
-    disconnected_clients = []  # 用于保存断开连接的客户端
-    for client in connected_clients:
-        try:
-            await client.send_text(json_data)
-        except Exception as e:
-            print(f"❌ WebSocket 推送失败: {e}")
-            disconnected_clients.append(client)  # 记录无法推送的客户端
-
-    # 移除断开连接的客户端
-    for client in disconnected_clients:
-        connected_clients.remove(client)
-        print("🔌 从客户端列表中移除断开连接的客户端")
+
+def percentile_ms(samples, q):
+    # samples 为秒，返回第 q 百分位的毫秒数
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] * 1000, 3)
+
+
+class AlertBridge:
+    # 线程 -> 事件循环的告警通道：服务启动时在事件循环中调用 start() 记下该循环，
+    # 任意线程调用 publish() 时通过 call_soon_threadsafe 把告警放入循环内的有界队列，
+    # 由一个常驻任务在同一个循环里调用 send_alert_message，connected_clients 只在该循环中被访问。
+    # 积压时一次取出队列中全部告警，同一设备上 (level, message) 相同的合并为一条推送，
+    # 推送中带上被合并的全部通知 ID；
+    # 队列满时丢弃最旧的告警
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self.loop = None
+        self._queue = None
+        self._task = None
+        self._latencies = deque(maxlen=1000)  # 最近若干条告警从 publish 到推送完成的耗时（秒）
+        self.counters = {"published": 0, "delivered": 0, "coalesced": 0, "dropped": 0}
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = self.loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.loop = self._task = None
+
+    # 可在任意线程（包括事件循环线程）调用，不等待推送完成
+    def publish(self, level: str, message: str, alert_id: int = 1, device_id: int = None):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            self.counters["dropped"] += 1
+            print(f"⚠️ 告警推送通道未启动，丢弃告警: {message}")
+            return False
+        loop.call_soon_threadsafe(self._enqueue, (time.perf_counter(), level, message, alert_id, device_id))
+        return True
+
+    def _enqueue(self, item):
+        self.counters["published"] += 1
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.counters["dropped"] += 1
+        self._queue.put_nowait(item)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            merged = {}  # (device_id, level, message) -> (最早 publish 时间, [通知 ID...])
+            for published_at, level, message, alert_id, device_id in batch:
+                merged.setdefault((device_id, level, message), (published_at, []))[1].append(alert_id)
+            self.counters["coalesced"] += len(batch) - len(merged)
+
+            for (device_id, level, message), (published_at, alert_ids) in merged.items():
+                try:
+                    await send_alert_message(level=level, message=message, alert_id=alert_ids[-1],
+                                             device_id=device_id, alert_ids=alert_ids)
+                except Exception as e:
+                    print(f"❌ 告警推送失败: {e}")
+                    continue
+                self.counters["delivered"] += 1
+                self._latencies.append(time.perf_counter() - published_at)
+
+    def stats(self):
+        latencies = list(self._latencies)
+        return {
+            "started": self.loop is not None,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            **self.counters,
+            "latency_p50_ms": percentile_ms(latencies, 50),
+            "latency_p95_ms": percentile_ms(latencies, 95),
+            "latency_max_ms": round(max(latencies) * 1000, 3) if latencies else None,
+        }
+
+
+alert_bridge = AlertBridge(max_queue=ALERT_BRIDGE_QUEUE_SIZE)
+
+
+# 告警推送通道状态：队列深度、合并 / 丢弃条数、从产生到放入各连接发送队列的延迟
+@router.get("/alert-bridge")
+def alert_bridge_stats():
+    return alert_bridge.stats()
+
+
+# 各连接发送队列状态：连接数、积压 / 丢弃 / 溢出断开数，以及发送延迟分布和最慢的若干连接
+@router.get("/clients")
+def client_stats(top: int = 10):
+    clients = [client.stats() for client in connected_clients.values()]
+    lags = [c["last_lag_ms"] / 1000 for c in clients]
+    return {
+        "connections": len(clients),
+        "policy": WS_OVERFLOW_POLICY,
+        "queued": sum(c["queue_depth"] for c in clients),
+        "dropped": sum(c["dropped"] for c in clients),
+        "slow_disconnects": slow_disconnects,
+        "lag_p50_ms": percentile_ms(lags, 50),
+        "lag_p95_ms": percentile_ms(lags, 95),
+        "slowest": sorted(clients, key=lambda c: (c["queue_depth"], c["last_lag_ms"]), reverse=True)[:top],
+    }
@@ -42,15 +42,18 @@ def authenticate_user(db: Session, email: str, password: str):
     return None
 
 
+def notification_message(level: str, message: str):
+    # 判断是否为危险或警告状态，给通知内容加上对应前缀
+    if level == "danger":
+        return f"危险：{message}"  # 用检测到的危险原因填充通知内容
+    elif level == "warning":
+        return f"警告：{message}"
+    return f"状态：{message}"  # 其他情况（可以扩展）
+
+
 def create_notification(db: Session, notification_data: schemas.NotificationCreate, user_id: int):
     # 创建通知，当设备检测到危险时
-    # 判断是否为危险或警告状态
-    if notification_data.level == "danger":
-        notification_data.message = f"危险：{notification_data.message}"  # 用检测到的危险原因填充通知内容
-    elif notification_data.level == "warning":
-        notification_data.message = f"警告：{notification_data.message}"
-    else:
-        notification_data.message = f"状态：{notification_data.message}"  # 其他情况（可以扩展）
+    notification_data.message = notification_message(notification_data.level, notification_data.message)
 
     notification = models.Notification(
         user_id=user_id,  # 绑定当前用户
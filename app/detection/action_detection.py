@@ -1,20 +1,49 @@
 # detection/action_detection.py
 import cv2
 import mediapipe as mp
+from app.detection.frame_packet import FramePacket
+from app.detection.model_registry import shared_pose_pool
 
 
 class ActionDetector:
     def __init__(self, detection_confidence=0.5):
-        self.pose = mp.solutions.pose.Pose(
+        self.detection_confidence = detection_confidence
+        # 计算图池由进程级注册表共享，每路流从池中检出独占的计算图
+        self.pose_pool = shared_pose_pool(self.new_pose, detection_confidence).model
+        self.pose = self.pose_pool.acquire()  # 未传入 StreamContext 时使用的默认计算图
+
+    # 构建一个新的 Pose 计算图，供 PosePool 按流分配
+    def new_pose(self):
+        return mp.solutions.pose.Pose(
             static_image_mode=False,
             model_complexity=1,
             enable_segmentation=False,
-            min_detection_confidence=detection_confidence
+            min_detection_confidence=self.detection_confidence
         )
 
-    def detect(self, frame):
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.pose.process(frame_rgb)
+    # 归还默认计算图，检测器不再使用时调用
+    def close(self):
+        if self.pose is not None:
+            self.pose_pool.release(self.pose)
+            self.pose = None
+
+    # MediaPipe 不支持批量推理，逐帧处理以保持与 detect 相同的结果
+    def detect_batch(self, frames, contexts=None):
+        contexts = contexts or [None] * len(frames)
+        return [self.detect(frame, context=context) for frame, context in zip(frames, contexts)]
+
+    # frame 可以是原始 BGR 帧，也可以是共享预处理结果的 FramePacket（复用其 RGB 缓冲区）；
+    # roi 为 (x1, y1, x2, y2) 时只在该区域内做姿态检测（级联模式），关键点坐标映射回整帧；
+    # context 为该路流的 StreamContext，使用其独占的 Pose 计算图
+    def detect(self, frame, roi=None, context=None):
+        packet = FramePacket.wrap(frame)
+        if roi is None:
+            frame_rgb = packet.rgb()
+        else:
+            x1, y1, x2, y2 = roi
+            frame_rgb = cv2.cvtColor(packet.frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB)
+        pose = context.pose if context is not None else self.pose
+        results = pose.process(frame_rgb)
 
         if not results.pose_landmarks:
             # 返回明确的错误信息
@@ -29,10 +58,19 @@ class ActionDetector:
         LEFT_HIP = 23
         RIGHT_HIP = 24
 
-        # 获取关键点坐标
-        nose_y = landmarks[NOSE].y
-        shoulder_y = (landmarks[LEFT_SHOULDER].y + landmarks[RIGHT_SHOULDER].y) / 2
-        hip_y = (landmarks[LEFT_HIP].y + landmarks[RIGHT_HIP].y) / 2
+        # 获取关键点坐标（归一化到整帧高度）
+        if roi is None:
+            def frame_y(index):
+                return landmarks[index].y
+        else:
+            frame_h = packet.shape[0]
+
+            def frame_y(index):
+                return (y1 + landmarks[index].y * (y2 - y1)) / frame_h
+
+        nose_y = frame_y(NOSE)
+        shoulder_y = (frame_y(LEFT_SHOULDER) + frame_y(RIGHT_SHOULDER)) / 2
+        hip_y = (frame_y(LEFT_HIP) + frame_y(RIGHT_HIP)) / 2
 
         # 逻辑判断
         if nose_y > hip_y + 0.05:
@@ -0,0 +1,59 @@
+# detection/backends.py
+import os
+
+import torch
+from ultralytics import YOLO
+
+# 支持的推理后端：torch 为原始 PyTorch 权重，onnx 走 ONNX Runtime，openvino 走 OpenVINO
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def _is_stale(exported_path, model_path):
+    # 导出文件不存在或早于 .pt 权重时需要重新导出
+    if not os.path.exists(exported_path):
+        return True
+    return os.path.getmtime(exported_path) < os.path.getmtime(model_path)
+
+
+def export_model(model_path, backend, int8=False, imgsz=640, calibration_data=None):
+    # 将 YOLO .pt 权重导出为指定后端格式（缓存在权重旁边），返回导出文件路径
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+    if backend == "torch":
+        return model_path
+
+    base, _ = os.path.splitext(model_path)
+
+    if backend == "onnx":
+        onnx_path = base + ".onnx"
+        if _is_stale(onnx_path, model_path):
+            # dynamic=True 以支持 detect_batch 的多帧输入
+            onnx_path = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True)
+        if not int8:
+            return onnx_path
+
+        int8_path = base + ".int8.onnx"
+        if _is_stale(int8_path, onnx_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return int8_path
+
+    # OpenVINO 的 INT8 量化需要校准数据（ultralytics 的 data 参数），未提供时使用 ultralytics 默认数据集
+    ov_dir = base + ("_int8_openvino_model" if int8 else "_openvino_model")
+    if _is_stale(ov_dir, model_path):
+        kwargs = {"format": "openvino", "imgsz": imgsz, "int8": int8, "dynamic": True}
+        if int8 and calibration_data:
+            kwargs["data"] = calibration_data
+        ov_dir = YOLO(model_path).export(**kwargs)
+    return ov_dir
+
+
+def load_model(model_path, backend="torch", device=None, int8=False):
+    # 按后端加载检测模型；非 torch 后端同样返回 ultralytics YOLO 对象，
+    # 推理接口和 Results 结构与 torch 后端一致，检测器的后处理无需区分后端
+    if backend == "torch":
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        return YOLO(model_path).to(device)
+
+    exported_path = export_model(model_path, backend, int8=int8)
+    return YOLO(exported_path, task="detect")
@@ -0,0 +1,169 @@
+# detection/benchmark.py
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from app.detection.frame_packet import FramePacket
+from app.detection.model_registry import registry
+from app.detection.multi_detector import MultiDetector, aggregate_findings
+from app.utils.video_utils import get_video_capture
+
+STAGES = ("decode", "preprocess", "danger", "tracker", "face", "pose", "aggregation", "total")
+
+
+def synthetic_video(path, frames=100, size=(640, 480), fps=10):
+    # 生成带运动目标的测试视频：渐变背景 + 匀速移动的矩形与圆 + 少量噪声，保证每帧内容都在变化
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = np.dstack([np.tile(np.linspace(40, 200, width, dtype=np.uint8), (height, 1))] * 3)
+    for index in range(frames):
+        frame = background.copy()
+        x = int((index * 7) % max(1, width - 120))
+        y = int(height / 2 + np.sin(index / 8) * height / 4) - 60
+        cv2.rectangle(frame, (x, y), (x + 120, y + 120), (30, 60, 200), -1)
+        cv2.circle(frame, (width - x - 40, height // 3), 40, (180, 200, 230), -1)
+        noise = rng.integers(0, 12, frame.shape, dtype=np.uint8)
+        writer.write(cv2.add(frame, noise))
+    writer.release()
+    return path
+
+
+class StageTimer:
+    # 按阶段记录每帧耗时（秒），汇总为 p50 / p95 / p99
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, elapsed):
+        self.samples.setdefault(stage, []).append(elapsed)
+
+    def timed(self, stage, func):
+        # 包装一个函数，每次调用的耗时计入 stage
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+    def summary(self):
+        report = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ms = np.array(samples) * 1000
+            report[stage] = {
+                "count": len(samples),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            }
+        return report
+
+
+def _peak_rss_mb():
+    # ru_maxrss 在 Linux 上单位为 KB，macOS 上为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def run_benchmark(video_path=None, frames=100, size=(640, 480), iterations=3, warmup_frames=5, progress=None):
+    # 逐帧执行与 MultiDetector.detect（串行、整帧模式）相同的流程，分别计时各子检测器；
+    # video_path 为空时生成合成视频，iterations 为整段视频重复处理的次数，前 warmup_frames 帧不计入统计；
+    # progress(已处理帧数, 预计总帧数) 每帧回调一次，总帧数未知时为 0
+    tmp_path = None
+    if video_path is None:
+        tmp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+        tmp_file.close()
+        tmp_path = video_path = synthetic_video(tmp_file.name, frames, size)
+
+    # 独立的 MultiDetector：模型来自注册表共享，计时包装不影响正在运行的检测流
+    detector = MultiDetector(cascade=False)
+    danger, suffocation, action = detector.danger_detector, detector.suffocation_detector, detector.action_detector
+    timer = StageTimer()
+    danger._track = timer.timed("tracker", danger._track)
+    context = detector.create_context("benchmark")
+    packet = FramePacket()
+
+    processed = 0
+    measured_time = 0.0
+    total_frames = 0
+    try:
+        for _ in range(iterations):
+            cap = get_video_capture(video_path)
+            if not total_frames:
+                total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))) * iterations
+            while True:
+                frame_start = time.perf_counter()
+                ret, frame = cap.read()
+                decode_time = time.perf_counter() - frame_start
+                if not ret:
+                    break
+
+                # preprocess 只含各检测器共享的 RGB 转换；YOLO 的 letterbox 在模型内部完成，计入各自阶段
+                start = time.perf_counter()
+                packet.load(frame)
+                packet.rgb()
+                preprocess_time = time.perf_counter() - start
+
+                tracker_samples = len(timer.samples["tracker"])
+                start = time.perf_counter()
+                danger_results = danger.detect(packet, context=context)
+                # 跟踪器在 danger.detect 内部运行并单独计时，从 danger 阶段中扣除，避免重复计入
+                danger_time = time.perf_counter() - start - sum(timer.samples["tracker"][tracker_samples:])
+
+                start = time.perf_counter()
+                suffocation_results = suffocation.detect(packet, context=context)
+                face_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                action_results = action.detect(packet, context=context)
+                pose_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                aggregate_findings(danger_results, suffocation_results, action_results)
+                aggregation_time = time.perf_counter() - start
+                total_time = time.perf_counter() - frame_start
+
+                processed += 1
+                if progress is not None:
+                    progress(processed, total_frames)
+                if processed <= warmup_frames:
+                    timer.samples["tracker"].clear()
+                    continue
+                for stage, elapsed in (("decode", decode_time), ("preprocess", preprocess_time),
+                                       ("danger", danger_time), ("face", face_time), ("pose", pose_time),
+                                       ("aggregation", aggregation_time), ("total", total_time)):
+                    timer.add(stage, elapsed)
+                measured_time += total_time
+            cap.release()
+    finally:
+        context.close()
+        detector.close()
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+    measured_frames = max(0, processed - warmup_frames)
+    return {
+        "config": {
+            "video": "synthetic" if tmp_path is not None else os.path.basename(video_path),
+            "frames": frames if tmp_path is not None else None,
+            "size": list(size) if tmp_path is not None else None,
+            "iterations": iterations,
+            "warmup_frames": warmup_frames,
+            "backend": danger.backend,
+            "device": danger.device,
+        },
+        "frames_measured": measured_frames,
+        "throughput_fps": round(measured_frames / measured_time, 2) if measured_time else 0,
+        "stages": timer.summary(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "models": registry.report()["models"],
+    }
@@ -1,15 +1,21 @@
 # detection/danger_detection.py
-import torch
 import numpy as np
-from ultralytics import YOLO
+from app.config import DANGER_MODEL_PATH
+from app.detection.model_registry import shared_detector_model
 from app.detection.sort import Sort
+from app.detection.frame_packet import FramePacket
+
+
+# COCO 中 person 的类别 ID，级联模式下用来裁剪人脸 / 姿态检测区域
+PERSON_CLS_ID = 0
 
 
 class DangerDetector:
-    def __init__(self, model_path="yolov8n.pt", device=None):
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = YOLO(model_path).to(self.device)
-        self.tracker = Sort(max_age=10, min_hits=3, iou_threshold=0.3)
+    def __init__(self, model_path=DANGER_MODEL_PATH, device=None, backend=None, int8=None):
+        self.model_entry, self.device, self.backend = shared_detector_model(model_path, device, backend, int8)
+        self.model = self.model_entry.model
+        self._lock = self.model_entry.lock
+        self.tracker = self.new_tracker()  # 未传入 StreamContext 时使用的默认跟踪器
 
         self.danger_categories = {
             "sharp_objects": {"ids": {42, 43, 44, 76}, "level": "danger"},
@@ -20,29 +26,88 @@ class DangerDetector:
             "small_electronics": {"ids": {24, 25, 26, 27, 28, 63, 66, 67, 73}, "level": "safe"},
         }
 
-    def detect(self, frame):
-        results = self.model(frame, conf=0.3, iou=0.5)
-        dangers = []
+        # 展平所有合法 ID 集合，传给模型让 NMS 只处理相关类别（person 供级联模式使用）
+        self.allowed_ids = set()
+        for category in self.danger_categories.values():
+            self.allowed_ids |= category["ids"]
+        self.model_classes = sorted(self.allowed_ids | {PERSON_CLS_ID})
+
+        # 类别 ID -> 危险类别下标的查找表，-1 表示不属于任何危险类别
+        self._category_names = list(self.danger_categories)
+        self._category_levels = [info["level"] for info in self.danger_categories.values()]
+        self._category_lut = np.full(max(self.model_classes) + 1, -1, dtype=np.int16)
+        for index, info in enumerate(self.danger_categories.values()):
+            self._category_lut[list(info["ids"])] = index
+
+    def new_tracker(self):
+        return Sort(max_age=10, min_hits=3, iou_threshold=0.3)
+
+    # frame 可以是原始 BGR 帧，也可以是共享预处理结果的 FramePacket；
+    # return_persons=True 时额外返回 person 框列表，供级联模式裁剪人脸 / 姿态检测区域；
+    # context 为该路流的 StreamContext，提供独立的跟踪器
+    def detect(self, frame, return_persons=False, context=None):
+        packet = FramePacket.wrap(frame)
+        with self._lock:
+            results = self.model(packet.frame, conf=0.3, iou=0.5, classes=self.model_classes)
+        tracker = context.tracker if context is not None else self.tracker
+        dangers, persons = [], []
         for result in results:
-            for box in result.boxes:
-                cls_id = int(box.cls.item())
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-
-                # Use the tracker to track the object across frames
-                detections = np.array([[x1, y1, x2, y2, box.conf.item()]])
-                tracked_objects = self.tracker.update(detections)
-
-                # Check if any tracked object matches the danger categories
-                for category, info in self.danger_categories.items():
-                    if cls_id in info["ids"]:
-                        danger_info = {
-                            "category": category,
-                            "level": info["level"],
-                            "bbox": (x1, y1, x2, y2),
-                            "confidence": float(box.conf.item()),
-                            "cls_id": cls_id
-                        }
-                        # Add the detection to the results list
-                        dangers.append(danger_info)
-
-        return dangers
+            result_dangers, result_persons = self._parse_result(result, packet, tracker)
+            dangers.extend(result_dangers)
+            persons.extend(result_persons)
+        return (dangers, persons) if return_persons else dangers
+
+    # 多帧批量检测：整批只跑一次前向，返回与 frames 一一对应的结果列表
+    # contexts 与 frames 一一对应，可以来自不同的流
+    def detect_batch(self, frames, return_persons=False, contexts=None):
+        packets = [FramePacket.wrap(frame) for frame in frames]
+        if not packets:
+            return []
+        trackers = [context.tracker for context in contexts] if contexts else [self.tracker] * len(packets)
+        with self._lock:
+            results = self.model([packet.frame for packet in packets], conf=0.3, iou=0.5, classes=self.model_classes, batch=len(packets))
+        parsed = [self._parse_result(result, packet, tracker)
+                  for result, packet, tracker in zip(results, packets, trackers)]
+        return parsed if return_persons else [dangers for dangers, _ in parsed]
+
+    def _parse_result(self, result, packet, tracker):
+        boxes = result.boxes
+        if len(boxes) == 0:
+            self._track(tracker, np.empty((0, 4)), np.empty((0,)))
+            return [], []
+
+        # 每个结果只做一次设备到 numpy 的拷贝
+        boxes_xyxy = boxes.xyxy.cpu().numpy().astype(int)
+        confs = boxes.conf.cpu().numpy()
+        cls_ids = boxes.cls.cpu().numpy().astype(int)
+
+        track_ids = self._track(tracker, boxes_xyxy, confs)
+
+        persons = [tuple(box) for box in boxes_xyxy[cls_ids == PERSON_CLS_ID].tolist()]
+
+        # 通过查找表一次性得到每个框的危险类别
+        category_ids = np.full(len(cls_ids), -1, dtype=np.int16)
+        in_range = cls_ids < len(self._category_lut)
+        category_ids[in_range] = self._category_lut[cls_ids[in_range]]
+        keep = np.flatnonzero(category_ids >= 0)
+
+        dangers = [
+            {
+                "category": self._category_names[category_id],
+                "level": self._category_levels[category_id],
+                "bbox": tuple(bbox),
+                "confidence": confidence,
+                "cls_id": cls_id,
+                "track_id": track_id
+            }
+            for category_id, bbox, confidence, cls_id, track_id in zip(
+                category_ids[keep].tolist(), boxes_xyxy[keep].tolist(), confs[keep].tolist(), cls_ids[keep].tolist(),
+                track_ids[keep].tolist())
+        ]
+
+        return dangers, persons
+
+    # Use the tracker to track the objects across frames: 每帧只推进一次跟踪器，返回每个框对应的轨迹 ID
+    def _track(self, tracker, boxes_xyxy, confs):
+        tracker.update(np.column_stack((boxes_xyxy, confs)))
+        return tracker.det_track_ids
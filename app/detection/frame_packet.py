@@ -0,0 +1,64 @@
+# detection/frame_packet.py
+import threading
+
+import cv2
+import numpy as np
+
+
+class FramePacket:
+    # 一帧图像的共享预处理结果：RGB 视图、缩放副本均在首次使用时计算并缓存，
+    # 同一个 FramePacket 反复 load 新帧时复用已分配的缓冲区，避免每帧重复转换和分配内存；
+    # YOLO 模型直接接收原始 BGR 帧，由 ultralytics 按步长对齐的最小矩形 letterbox（auto=True）预处理，
+    # 输入尺寸和检测结果与直接调用模型完全一致
+    def __init__(self, frame=None):
+        self.frame = None
+        # MultiDetector 并发模式下多个子检测器可能同时触发同一缓存的计算
+        self._lock = threading.Lock()
+
+        self._rgb_buf = None
+        self._rgb_ready = False
+
+        self._resized_bufs = {}  # (w, h) -> uint8 缓冲区
+        self._resized_ready = set()
+
+        if frame is not None:
+            self.load(frame)
+
+    # 检测器入口统一调用：已经是 FramePacket 则原样返回，否则包装原始 BGR 帧
+    @classmethod
+    def wrap(cls, frame):
+        if isinstance(frame, FramePacket):
+            return frame
+        return cls(frame)
+
+    def load(self, frame):
+        self.frame = frame
+        self._rgb_ready = False
+        self._resized_ready.clear()
+        return self
+
+    @property
+    def shape(self):
+        return self.frame.shape
+
+    def rgb(self):
+        with self._lock:
+            if not self._rgb_ready:
+                if self._rgb_buf is None or self._rgb_buf.shape != self.frame.shape:
+                    self._rgb_buf = np.empty_like(self.frame)
+                cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+                self._rgb_ready = True
+            return self._rgb_buf
+
+    # size 与 cv2.resize 一致，为 (width, height)
+    def resized(self, size):
+        size = tuple(size)
+        with self._lock:
+            buf = self._resized_bufs.get(size)
+            if buf is None:
+                buf = np.empty((size[1], size[0], 3), dtype=np.uint8)
+                self._resized_bufs[size] = buf
+            if size not in self._resized_ready:
+                cv2.resize(self.frame, size, dst=buf)
+                self._resized_ready.add(size)
+            return buf
@@ -0,0 +1,264 @@
+# detection/inference_pool.py
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from app.detection.shared_ring import SharedFrameRing
+
+
+# 推理子进程入口：每个进程启动时加载一次自己的 MultiDetector，之后循环处理帧
+def _worker_main(worker_index, task_queue, result_queue, torch_threads):
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from app.detection.multi_detector import MultiDetector
+    detector = MultiDetector()
+    contexts = {}  # stream_id -> StreamContext，本进程负责的每路流各自的时序状态
+    rings = {}  # stream_id -> 已映射的 SharedFrameRing（只读）
+    result_queue.put(("ready", worker_index, None, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        job_id, stream_id, frame = task
+        if job_id is None:
+            # 流已停止，归还其 Pose 计算图并丢弃跟踪状态
+            context = contexts.pop(stream_id, None)
+            if context is not None:
+                context.close()
+            ring = rings.pop(stream_id, None)
+            if ring is not None:
+                ring.close()
+            continue
+        try:
+            context = contexts.get(stream_id)
+            if context is None:
+                context = contexts[stream_id] = detector.create_context(stream_id)
+            if isinstance(frame, tuple):
+                # 共享内存模式：队列中只有 (环形缓冲区名, 序号)，直接在共享内存视图上推理
+                ring_name, seq = frame
+                ring = rings.get(stream_id)
+                if ring is None or ring.name != ring_name:
+                    if ring is not None:
+                        ring.close()
+                    ring = rings[stream_id] = SharedFrameRing.attach(ring_name)
+                entry = ring.read(seq)
+                if entry is None:
+                    raise RuntimeError(f"帧 {seq} 在推理前已被覆盖")
+                result = detector.detect(entry[0], context=context)
+                del entry
+                if not ring.is_valid(seq):
+                    raise RuntimeError(f"帧 {seq} 在推理期间被覆盖")
+            else:
+                result = detector.detect(frame, context=context)
+            result_queue.put(("result", worker_index, job_id, result))
+        except Exception as e:
+            result_queue.put(("error", worker_index, job_id, repr(e)))
+
+
+class InferencePool:
+    # 进程池推理引擎：N 个推理进程各自持有模型，帧通过队列送入、结果通过队列返回；
+    # 同一路流固定分配到同一个进程，进程内为每路流维护独立的 StreamContext（无脸计时、跟踪器等）；
+    # 监控线程发现进程崩溃后会让其未完成任务失败并重启该进程；
+    # shared_memory=True 时每路流一个 SharedFrameRing，帧写入共享内存，队列中只传序号，避免 pickle 整帧
+    def __init__(self, num_workers=2, max_pending=8, torch_threads=None,
+                 submit_timeout=5.0, check_interval=0.5, shared_memory=False):
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.torch_threads = torch_threads
+        self.submit_timeout = submit_timeout
+        self.check_interval = check_interval
+        self.shared_memory = shared_memory
+        self._rings = {}  # stream_id -> SharedFrameRing（写入端）
+
+        self._ctx = multiprocessing.get_context("spawn")
+        # 每个进程独立的任务/结果队列：进程被强杀时可能持有队列内部锁，重启时整体替换
+        self._task_queues = [None] * num_workers
+        self._result_queues = [None] * num_workers
+        self._generations = [0] * num_workers
+        self._processes = [None] * num_workers
+        self._ready = [False] * num_workers
+        self.restarts = [0] * num_workers
+
+        self._pending = {}  # job_id -> (worker_index, future)
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.num_workers):
+            self._spawn(index)
+        t = threading.Thread(target=self._supervise, name="inference-pool-supervisor", daemon=True)
+        t.start()
+        self._threads.append(t)
+        return self
+
+    def _spawn(self, index):
+        task_queue = self._ctx.Queue(maxsize=self.max_pending)
+        result_queue = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, task_queue, result_queue, self.torch_threads),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+
+        self._generations[index] += 1
+        self._task_queues[index] = task_queue
+        self._result_queues[index] = result_queue
+        self._processes[index] = process
+        self._ready[index] = False
+
+        collector = threading.Thread(target=self._collect_results,
+                                     args=(index, self._generations[index], result_queue),
+                                     name=f"inference-pool-collector-{index}", daemon=True)
+        collector.start()
+        self._threads = [t for t in self._threads if t.is_alive()] + [collector]
+
+    def _worker_for(self, stream_id):
+        return hash(stream_id) % self.num_workers
+
+    # 提交一帧，返回 concurrent.futures.Future，结果结构与 MultiDetector.detect 相同
+    def submit(self, stream_id, frame):
+        if self._stop.is_set():
+            raise RuntimeError("推理进程池已关闭")
+
+        index = self._worker_for(stream_id)
+        job_id = next(self._job_ids)
+        future = Future()
+        with self._lock:
+            self._pending[job_id] = (index, future)
+
+        if self.shared_memory:
+            ring = self._ring_for(stream_id, frame)
+            frame = (ring.name, ring.write(frame, time.time()))
+
+        try:
+            # 队列有界：推理跟不上时在这里形成背压，而不是无限堆积帧
+            self._task_queues[index].put((job_id, stream_id, frame), timeout=self.submit_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            future.set_exception(TimeoutError(f"推理进程 {index} 繁忙，帧提交超时"))
+        return future
+
+    # timeout 秒内没有结果时放弃该帧并抛出 TimeoutError（例如任务恰好提交给了刚崩溃的进程）
+    def detect(self, stream_id, frame, timeout=None):
+        future = self.submit(stream_id, frame)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                expired = [job_id for job_id, (_, pending) in self._pending.items() if pending is future]
+                for job_id in expired:
+                    del self._pending[job_id]
+            raise TimeoutError(f"流 {stream_id} 的推理结果等待超时（{timeout}s）")
+
+    # 每路流只有一个提交线程，即环形缓冲区的唯一写入方；槽位数比队列容量多 2，
+    # 背压生效时写入方不会追上仍在排队的帧；帧尺寸变大时换一个新的缓冲区
+    def _ring_for(self, stream_id, frame):
+        ring = self._rings.get(stream_id)
+        if ring is None or not ring.fits(frame):
+            if ring is not None:
+                ring.close()
+            ring = self._rings[stream_id] = SharedFrameRing.create(frame.shape, slots=self.max_pending + 2)
+        return ring
+
+    # 流停止后通知对应进程释放该流的 StreamContext
+    def release_stream(self, stream_id):
+        if not self._stop.is_set():
+            index = self._worker_for(stream_id)
+            try:
+                self._task_queues[index].put((None, stream_id, None), timeout=self.submit_timeout)
+            except queue.Full:
+                print(f"⚠️ 推理进程 {index} 繁忙，未能释放流 {stream_id} 的检测状态")
+        ring = self._rings.pop(stream_id, None)
+        if ring is not None:
+            ring.close()
+
+    # 每代进程一个收集线程，进程被重启后旧线程随之退出
+    def _collect_results(self, index, generation, result_queue):
+        while not self._stop.is_set() and self._generations[index] == generation:
+            try:
+                kind, _, job_id, payload = result_queue.get(timeout=self.check_interval)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if kind == "ready":
+                self._ready[index] = True
+                continue
+
+            with self._lock:
+                entry = self._pending.pop(job_id, None)
+            if entry is None:
+                continue
+            future = entry[1]
+            if kind == "result":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _supervise(self):
+        while not self._stop.wait(self.check_interval):
+            for index, process in enumerate(self._processes):
+                if process is None or process.is_alive():
+                    continue
+                print(f"⚠️ 推理进程 {index} 已退出 (exitcode={process.exitcode})，正在重启")
+                self._fail_pending(index, RuntimeError(f"推理进程 {index} 崩溃"))
+                # 崩溃进程可能留下损坏的队列，旧队列中的帧随之丢弃
+                self._task_queues[index].cancel_join_thread()
+                self._result_queues[index].cancel_join_thread()
+                self._spawn(index)
+                self.restarts[index] += 1
+
+    def _fail_pending(self, index, error):
+        with self._lock:
+            failed = [job_id for job_id, (worker, _) in self._pending.items() if worker == index]
+            futures = [self._pending.pop(job_id)[1] for job_id in failed]
+        for future in futures:
+            future.set_exception(error)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "workers": self.num_workers,
+            "alive": [bool(p and p.is_alive()) for p in self._processes],
+            "ready": list(self._ready),
+            "restarts": list(self.restarts),
+            "pending": pending,
+        }
+
+    def shutdown(self, timeout=5.0):
+        self._stop.set()
+        for task_queue in self._task_queues:
+            try:
+                task_queue.put_nowait(None)
+            except (queue.Full, ValueError):
+                pass
+
+        deadline = time.time() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+
+        for index in range(self.num_workers):
+            self._fail_pending(index, RuntimeError("推理进程池已关闭"))
+        for t in self._threads:
+            t.join(timeout=1.0)
+        self._threads = []
+        for ring in self._rings.values():
+            ring.close()
+        self._rings = {}
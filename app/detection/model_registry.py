@@ -0,0 +1,130 @@
+# detection/model_registry.py
+import threading
+import time
+
+import numpy as np
+import torch
+
+from app.config import DETECTION_BACKEND, DETECTION_INT8
+from app.detection.backends import load_model
+from app.detection.stream_context import PosePool
+
+
+def _rss_bytes():
+    # 当前进程常驻内存；未安装 psutil 时退回 ru_maxrss（峰值，Linux 单位为 KB）
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _param_bytes(model):
+    # torch 后端的参数 + buffer 字节数；导出后端（onnx / openvino）无法统计时返回 None
+    module = getattr(model, "model", None)
+    if not isinstance(module, torch.nn.Module):
+        return None
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelEntry:
+    # 注册表中的一个共享模型：同一模型的所有使用者共用 lock 串行推理
+    def __init__(self, key, model):
+        self.key = key
+        self.model = model
+        self.lock = threading.Lock()
+        self.load_time = 0.0
+        self.warmup_time = 0.0
+        self.rss_delta = 0
+        self.param_bytes = None
+
+
+class ModelRegistry:
+    # 进程级模型注册表：每个模型在进程内只加载一次，之后返回同一个实例；
+    # 加载后执行预热推理，避免首帧承担初始化开销，并记录加载前后的常驻内存增量
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, warmup=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            entry = ModelEntry(key, loader())
+            entry.load_time = time.perf_counter() - start
+
+            if warmup is not None:
+                start = time.perf_counter()
+                warmup(entry.model)
+                entry.warmup_time = time.perf_counter() - start
+
+            entry.rss_delta = max(0, _rss_bytes() - rss_before)
+            entry.param_bytes = _param_bytes(entry.model)
+            self._entries[key] = entry
+            print(f"✅ 模型已加载: {key[0]} {key[1]} ({entry.load_time:.2f}s, 预热 {entry.warmup_time:.2f}s)")
+            return entry
+
+    def report(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "rss_mb": round(_rss_bytes() / 2 ** 20, 1),
+            "models": [
+                {
+                    "key": [str(part) for part in entry.key],
+                    "load_time": round(entry.load_time, 4),
+                    "warmup_time": round(entry.warmup_time, 4),
+                    "rss_delta_mb": round(entry.rss_delta / 2 ** 20, 1),
+                    "param_mb": round(entry.param_bytes / 2 ** 20, 1) if entry.param_bytes is not None else None,
+                }
+                for entry in entries
+            ],
+        }
+
+
+registry = ModelRegistry()
+
+
+def default_device():
+    # 未指定设备时的推理设备，检测器与结果缓存指纹共用
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def shared_yolo(model_path, backend, device, int8, imgsz=640, warmup_runs=2):
+    # 按 (模型路径, 后端, 设备, 是否 INT8) 共享 YOLO 模型，预热与实际推理一样传入 BGR 图像
+    def warmup(model):
+        blank = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        for _ in range(warmup_runs):
+            model(blank)
+
+    key = ("yolo", model_path, backend, device, int8)
+    return registry.get(key, lambda: load_model(model_path, backend, device, int8), warmup)
+
+
+def shared_detector_model(model_path, device=None, backend=None, int8=None):
+    # 检测器取模型的公共入口：补全默认设备 / 后端 / 量化配置后从注册表取共享模型，
+    # 同一进程内多个检测器实例不会重复加载；返回 (entry, device, backend)。
+    # ultralytics 的 predictor 不是线程安全的，共享同一模型的调用方推理时都要持有 entry.lock
+    device = device or default_device()
+    backend = backend or DETECTION_BACKEND
+    entry = shared_yolo(model_path, backend, device, DETECTION_INT8 if int8 is None else int8)
+    return entry, device, backend
+
+
+def shared_pose_pool(factory, detection_confidence):
+    # 按置信度阈值共享 MediaPipe Pose 计算图池，预热时先构建一个计算图并处理一帧空白图像
+    def warmup(pool):
+        pose = pool.acquire()
+        try:
+            pose.process(np.zeros((480, 640, 3), dtype=np.uint8))
+        finally:
+            pool.release(pose)
+
+    key = ("pose_pool", detection_confidence)
+    return registry.get(key, lambda: PosePool(factory), warmup)
@@ -0,0 +1,78 @@
+# detection/motion_gate.py
+import copy
+import time
+
+import cv2
+import numpy as np
+
+from app.config import NO_FACE_DANGER_SEC
+from app.detection.frame_packet import FramePacket
+from app.detection.multi_detector import aggregate_findings
+
+
+class MotionGate:
+    # 运动门控：在 MultiDetector.detect 之前用缩小灰度图做帧差，画面基本不变时复用上一次的检测结果，
+    # 只推进无脸计时这类随时间变化的状态；距上次完整推理超过 max_interval 秒时强制推理一次
+    def __init__(self, size=(160, 120), pixel_threshold=25, change_ratio=0.01,
+                 max_interval=2.0, danger_threshold_sec=NO_FACE_DANGER_SEC):
+        self.size = size  # (width, height)
+        self.pixel_threshold = pixel_threshold  # 单个像素灰度差超过该值视为变化
+        self.change_ratio = change_ratio  # 变化像素比例超过该值视为画面变化
+        self.max_interval = max_interval
+        self.danger_threshold_sec = danger_threshold_sec  # 默认与 SuffocationDetector 共用 NO_FACE_DANGER_SEC
+
+        self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._diff = np.empty_like(self._gray)
+        self._reference = None  # 上一次完整推理时的缩小灰度图
+
+        self.last_result = None
+        self.last_full_time = None
+        self.stats = {"frames": 0, "inferred": 0, "skipped": 0, "forced": 0}
+
+    def _small_gray(self, packet):
+        cv2.cvtColor(packet.resized(self.size), cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.GaussianBlur(self._gray, (5, 5), 0, dst=self._gray)
+        return self._gray
+
+    # 与上一次完整推理时的画面比较；以推理帧为基准，缓慢漂移累积到阈值也会触发推理
+    def changed(self, packet):
+        gray = self._small_gray(packet)
+        if self._reference is None:
+            return True
+        cv2.absdiff(gray, self._reference, dst=self._diff)
+        changed_pixels = np.count_nonzero(self._diff > self.pixel_threshold)
+        return changed_pixels >= self.change_ratio * self._diff.size
+
+    # detect 为实际推理函数（如 MultiDetector.detect 或推理进程池），返回结构与 MultiDetector.detect 相同
+    def run(self, detect, frame, now=None):
+        now = time.time() if now is None else now
+        packet = FramePacket.wrap(frame)
+        self.stats["frames"] += 1
+
+        changed = self.changed(packet)
+        expired = self.last_full_time is not None and now - self.last_full_time >= self.max_interval
+        if changed or expired or self.last_result is None:
+            if expired and not changed:
+                self.stats["forced"] += 1
+            result = detect(packet)
+            self.stats["inferred"] += 1
+            self._reference = self._gray.copy()
+            self.last_result = result
+            self.last_full_time = now
+            return result
+
+        self.stats["skipped"] += 1
+        return self._advance(now)
+
+    # 复用上一次结果，只把无脸持续时间推进到当前时刻并重新计算等级
+    def _advance(self, now):
+        details = copy.deepcopy(self.last_result["details"])
+        elapsed = now - self.last_full_time
+        for item in details["suffocation_detection"]:
+            if item.get("bbox") is None and "duration" in item:
+                duration = item["duration"] + elapsed
+                item["duration"] = round(duration, 2)
+                item["level"] = "danger" if duration >= self.danger_threshold_sec else "warning"
+        return aggregate_findings(details["danger_detection"],
+                                  details["suffocation_detection"],
+                                  details["action_detection"])
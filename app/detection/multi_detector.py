@@ -1,114 +1,220 @@
-import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-import cv2
+from app.config import DETECTION_CASCADE
 from app.detection.danger_detection import DangerDetector
 from app.detection.suffocation_detection import SuffocationDetector
 from app.detection.action_detection import ActionDetector
+from app.detection.frame_packet import FramePacket
+from app.detection.stream_context import StreamContext
 import time
 
 
-class MultiDetector:
-    def __init__(self):
-        self.danger_detector = DangerDetector()
-        self.suffocation_detector = SuffocationDetector()
-        self.action_detector = ActionDetector()
-
-    def detect(self, frame):
-        danger_results = self.danger_detector.detect(frame)
-        suffocation_results = self.suffocation_detector.detect(frame)
-        action_results = self.action_detector.detect(frame)
-
-        # 收集所有风险项
-        all_findings = {
-            "danger_detection": danger_results,
-            "suffocation_detection": suffocation_results,
-            "action_detection": action_results,
-        }
-
-        # 提取所有 level 并计算最严重等级
-        level_priority = {"safe": 0, "warning": 1, "danger": 2}
-        max_level = "safe"
-        causes = []
-
-        for detection_type, items in all_findings.items():
-            for item in items:
-                level = item.get("level", "safe")
-                if level_priority[level] > level_priority[max_level]:
-                    max_level = level
-                # 收集原因
-                reason = item.get("reason") or item.get("category") or detection_type
-                causes.append({
-                    "type": detection_type,
-                    "reason": reason,
-                    "level": level
-                })
-
-        return {
-            "overall_level": max_level,
-            "causes": causes,
-            "details": all_findings
-        }
-
-
-# 仅供timing接口测试耗时所用，处理视频并返回耗时信息
-def process_video_with_timing(video_bytes: bytes) -> dict:
-    import tempfile
-    detector = MultiDetector()
-
-    # 写入临时文件用于 VideoCapture
-    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp_file:
-        tmp_file.write(video_bytes)
-        tmp_path = tmp_file.name
+def aggregate_findings(danger_results, suffocation_results, action_results):
+    # 收集所有风险项
+    all_findings = {
+        "danger_detection": danger_results,
+        "suffocation_detection": suffocation_results,
+        "action_detection": action_results,
+    }
 
-    cap = cv2.VideoCapture(tmp_path)
-    if not cap.isOpened():
-        os.remove(tmp_path)
-        return {"error": "无法打开视频"}
+    # 提取所有 level 并计算最严重等级
+    level_priority = {"safe": 0, "warning": 1, "danger": 2}
+    max_level = "safe"
+    causes = []
+
+    for detection_type, items in all_findings.items():
+        for item in items:
+            level = item.get("level", "safe")
+            if level_priority[level] > level_priority[max_level]:
+                max_level = level
+            # 收集原因
+            reason = item.get("reason") or item.get("category") or detection_type
+            causes.append({
+                "type": detection_type,
+                "reason": reason,
+                "level": level
+            })
 
-    total_frames = 0
-    timings = {
-        "preprocess": 0.0,
-        "inference": 0.0,
-        "postprocess": 0.0
+    return {
+        "overall_level": max_level,
+        "causes": causes,
+        "details": all_findings
     }
 
-    start_total = time.time()
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+def person_rois(person_boxes, frame_shape, padding=0.15, max_coverage=0.6, min_size=32):
+    # 按 padding 比例扩展 person 框并裁剪到画面内，相互重叠的区域合并为一个；
+    # 合并后的区域覆盖了画面大部分时返回空列表，退回整帧检测
+    h, w = frame_shape[:2]
+    rois = []
+    for x1, y1, x2, y2 in person_boxes:
+        pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+        roi = [max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)), min(w, int(x2 + pad_x)), min(h, int(y2 + pad_y))]
+        if roi[2] - roi[0] >= min_size and roi[3] - roi[1] >= min_size:
+            rois.append(roi)
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rois)):
+            for j in range(i + 1, len(rois)):
+                a, b = rois[i], rois[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rois[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rois[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in rois)
+    if covered > max_coverage * w * h:
+        return []
+    return [tuple(roi) for roi in rois]
 
-        total_frames += 1
 
-        # 预处理阶段（可根据需要扩展）
-        start = time.time()
-        input_frame = cv2.resize(frame, (640, 480))
-        end = time.time()
-        timings["preprocess"] += end - start
+class MultiDetector:
+    # concurrent=True 时三个子检测器在有界线程池中并行执行（torch / MediaPipe 推理期间会释放 GIL）；
+    # cascade=True 时先跑危险物检测，再用 person 框裁剪出的区域做人脸和姿态检测，未检测到人时退回整帧
+    def __init__(self, concurrent=False, max_workers=3, cascade=None, roi_padding=0.15):
+        self.danger_detector = DangerDetector()
+        self.suffocation_detector = SuffocationDetector()
+        self.action_detector = ActionDetector()
+
+        self.cascade = DETECTION_CASCADE if cascade is None else cascade
+        self.roi_padding = roi_padding
+
+        self.concurrent = concurrent
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="multi-detector") if concurrent else None
+
+        # 并发模式的耗时统计：serial_time 为三个子检测器耗时之和，wall_time 为实际耗时
+        self._stats_lock = threading.Lock()
+        self.last_saved_time = 0.0
+        self.overlap_stats = {"calls": 0, "serial_time": 0.0, "wall_time": 0.0, "saved_time": 0.0}
+
+        # 每个调用线程各自持有可复用的 FramePacket，预处理缓冲区在帧之间复用
+        self._local = threading.local()
+
+    # 为一路流创建独立的检测状态（跟踪器、无脸计时、Pose 计算图），流结束时调用 close() 归还
+    def create_context(self, stream_id):
+        return StreamContext(stream_id, self.danger_detector.new_tracker(), self.action_detector.pose_pool)
+
+    # context 为 None 时使用各检测器自带的默认状态，仅适用于单路流
+    def detect(self, frame, context=None):
+        packet = frame if isinstance(frame, FramePacket) else self._packets(1)[0].load(frame)
+        if self.cascade:
+            danger_results, persons = self.danger_detector.detect(packet, return_persons=True, context=context)
+            return self._detect_cascade(packet, danger_results, persons, context)
+
+        danger_results, suffocation_results, action_results = self._run_detectors("detect", packet,
+                                                                                  context=context)
+
+        return aggregate_findings(danger_results, suffocation_results, action_results)
+
+    # 多帧批量检测：每个 YOLO 模型对整批帧只做一次前向，返回与逐帧 detect 相同结构的结果列表；
+    # contexts 与 frames 一一对应，同一批中可以混合多路流的帧
+    def detect_batch(self, frames, contexts=None):
+        frames = list(frames)
+        packets = self._packets(len(frames))
+        frames = [frame if isinstance(frame, FramePacket) else packet.load(frame)
+                  for frame, packet in zip(frames, packets)]
+        if self.cascade:
+            danger_batch = self.danger_detector.detect_batch(frames, return_persons=True, contexts=contexts)
+            contexts = contexts or [None] * len(frames)
+            return [self._detect_cascade(packet, danger_results, persons, context)
+                    for packet, (danger_results, persons), context in zip(frames, danger_batch, contexts)]
+
+        danger_batch, suffocation_batch, action_batch = self._run_detectors("detect_batch", frames,
+                                                                            contexts=contexts)
+
+        return [
+            aggregate_findings(danger_results, suffocation_results, action_results)
+            for danger_results, suffocation_results, action_results
+            in zip(danger_batch, suffocation_batch, action_batch)
+        ]
+
+    def _packets(self, count):
+        packets = getattr(self._local, "packets", None)
+        if packets is None:
+            packets = self._local.packets = []
+        while len(packets) < count:
+            packets.append(FramePacket())
+        return packets[:count]
+
+    def _detect_cascade(self, packet, danger_results, persons, context=None):
+        rois = person_rois(persons, packet.shape, self.roi_padding)
+        # MediaPipe Pose 只跟踪单人，取面积最大的区域
+        pose_roi = max(rois, key=lambda r: (r[2] - r[0]) * (r[3] - r[1])) if rois else None
+        suffocation_results, action_results = self._run_calls([
+            (self.suffocation_detector.detect, (packet, rois or None, context)),
+            (self.action_detector.detect, (packet, pose_roi, context)),
+        ])
+        return aggregate_findings(danger_results, suffocation_results, action_results)
+
+    def _run_detectors(self, method, arg, **kwargs):
+        detectors = (self.danger_detector, self.suffocation_detector, self.action_detector)
+        return self._run_calls([(partial(getattr(detector, method), **kwargs), (arg,)) for detector in detectors])
+
+    def _run_calls(self, calls):
+        if self._executor is None:
+            return [func(*args) for func, args in calls]
+
+        start = time.perf_counter()
+        futures = [self._executor.submit(self._timed_call, func, args) for func, args in calls]
+        outputs = [future.result() for future in futures]
+        wall_time = time.perf_counter() - start
+
+        serial_time = sum(elapsed for _, elapsed in outputs)
+        saved_time = max(0.0, serial_time - wall_time)
+        with self._stats_lock:
+            self.last_saved_time = saved_time
+            self.overlap_stats["calls"] += 1
+            self.overlap_stats["serial_time"] += serial_time
+            self.overlap_stats["wall_time"] += wall_time
+            self.overlap_stats["saved_time"] += saved_time
+
+        return [result for result, _ in outputs]
+
+    @staticmethod
+    def _timed_call(func, args):
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+    # 返回并发模式节省的墙钟时间（秒）
+    def get_overlap_report(self):
+        with self._stats_lock:
+            stats = dict(self.overlap_stats)
+            last_saved_time = self.last_saved_time
+        calls = stats["calls"]
+        return {
+            "concurrent": self.concurrent,
+            "calls": calls,
+            "serial_time": round(stats["serial_time"], 4),
+            "wall_time": round(stats["wall_time"], 4),
+            "saved_time": round(stats["saved_time"], 4),
+            "avg_saved_per_call": round(stats["saved_time"] / calls, 4) if calls else 0,
+            "last_saved_time": round(last_saved_time, 4),
+        }
 
-        # 推理阶段
-        start = time.time()
-        _ = detector.detect(input_frame)
-        end = time.time()
-        timings["inference"] += end - start
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.action_detector.close()
 
-        # 后处理阶段
-        start = time.time()
-        time.sleep(0.001)
-        end = time.time()
-        timings["postprocess"] += end - start
 
-    cap.release()
-    os.remove(tmp_path)
+_shared_detector = None
+_shared_detector_lock = threading.Lock()
 
-    total_time = time.time() - start_total
 
-    return {
-        "frame_count": total_frames,
-        "preprocess": round(timings["preprocess"], 4),
-        "inference": round(timings["inference"], 4),
-        "postprocess": round(timings["postprocess"], 4),
-        "total": round(total_time, 4),
-        "avg_per_frame": round(total_time / total_frames, 4) if total_frames else 0
-    }
+# 进程内共享的 MultiDetector，各路流通过 create_context 获得独立状态
+def get_shared_detector():
+    global _shared_detector
+    with _shared_detector_lock:
+        if _shared_detector is None:
+            _shared_detector = MultiDetector()
+        return _shared_detector
@@ -0,0 +1,200 @@
+# detection/offline.py
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from app.config import NO_FACE_DANGER_SEC, RESULT_CACHE_ENABLED
+from app.detection.multi_detector import aggregate_findings
+from app.detection.result_cache import file_sha256, result_cache
+
+# 子进程内的 MultiDetector，由 _init_worker 在进程启动时创建一次
+_worker_detector = None
+
+
+def _init_worker(torch_threads):
+    global _worker_detector
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from app.detection.multi_detector import MultiDetector
+    _worker_detector = MultiDetector()
+
+
+def probe_video(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"无法打开视频源: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return fps, frame_count
+
+
+def _open_at(path, frame_index):
+    # 定位到 frame_index，保证下一次 read / grab 得到的正是这一帧：
+    # 先用 CAP_PROP_POS_FRAMES 定位并核对位置，不一致时（部分容器 / 编码下定位会落在关键帧附近）
+    # 重新打开视频从头 grab 到目标帧，代价是多解码一段，但帧号与单进程顺序读取完全一致
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"无法打开视频源: {path}")
+    if frame_index <= 0:
+        return cap
+    if cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_index:
+        return cap
+
+    print(f"⚠️ 定位到第 {frame_index} 帧不准确，改为从头顺序跳帧: {path}")
+    cap.release()
+    cap = cv2.VideoCapture(path)
+    for _ in range(frame_index):
+        if not cap.grab():
+            break
+    return cap
+
+
+# 处理一个片段：从 read_start 定位后顺序解码到 end，每 stride 帧检测一次；
+# read_start 早于片段起点的部分为重叠区，用于预热跟踪器和姿态状态，并供拼接时对齐轨迹 ID
+def _analyze_segment(task):
+    path, segment_index, read_start, end, stride, fps = task
+    cap = _open_at(path, read_start)
+
+    context = _worker_detector.create_context(f"segment-{segment_index}")
+    media_time = [0.0]
+    context.clock = lambda: media_time[0]  # 无脸计时按视频时间而不是墙钟推进
+
+    frames = []
+    try:
+        for index in range(read_start, end):
+            if index % stride:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            media_time[0] = index / fps
+            detection = _worker_detector.detect(frame, context=context)
+            frames.append({"frame_index": index, "timestamp": round(index / fps, 3), "detection": detection})
+    finally:
+        context.close()
+        cap.release()
+    return segment_index, frames
+
+
+def _link_tracks(frames, segment_start, previous, next_track_id):
+    # 重叠区内同一帧在前后两个片段中的检测框完全一致，按 (bbox, cls_id) 把本片段的轨迹 ID 映射到前一片段的全局 ID；
+    # 未能对齐的轨迹分配新的全局 ID
+    mapping = {}
+    for item in frames:
+        if item["frame_index"] >= segment_start:
+            break
+        earlier = previous.get(item["frame_index"])
+        if earlier is None:
+            continue
+        known = {(d["bbox"], d["cls_id"]): d["track_id"] for d in earlier["detection"]["details"]["danger_detection"]}
+        for danger in item["detection"]["details"]["danger_detection"]:
+            global_id = known.get((danger["bbox"], danger["cls_id"]))
+            if global_id is not None:
+                mapping.setdefault(danger["track_id"], global_id)
+
+    emitted = []
+    for item in frames:
+        if item["frame_index"] < segment_start:
+            continue
+        for danger in item["detection"]["details"]["danger_detection"]:
+            if danger["track_id"] not in mapping:
+                mapping[danger["track_id"]] = next_track_id
+                next_track_id += 1
+            danger["track_id"] = mapping[danger["track_id"]]
+        emitted.append(item)
+    return emitted, next_track_id
+
+
+def _restitch_no_face(results, danger_threshold_sec):
+    # 各片段的无脸计时在片段起点重新开始，这里按视频时间戳在整段结果上重新计算持续时间和等级
+    no_face_start = None
+    for item in results:
+        details = item["detection"]["details"]
+        missing = [s for s in details["suffocation_detection"] if s.get("bbox") is None and "duration" in s]
+        if not missing:
+            no_face_start = None
+            continue
+        if no_face_start is None:
+            no_face_start = item["timestamp"]
+        duration = item["timestamp"] - no_face_start
+        for entry in missing:
+            entry["duration"] = round(duration, 2)
+            entry["level"] = "danger" if duration >= danger_threshold_sec else "warning"
+        item["detection"] = aggregate_findings(details["danger_detection"], details["suffocation_detection"],
+                                               details["action_detection"])
+
+
+def analyze_video(path, workers=None, segment_seconds=60.0, sample_fps=5.0, overlap_samples=5,
+                  torch_threads=1, danger_threshold_sec=NO_FACE_DANGER_SEC, use_cache=True):
+    # 离线分析长录像：按帧号切成若干片段，在进程池中并行检测（每个进程持有自己的 MultiDetector），
+    # 再按顺序拼接逐帧结果，修正片段边界处的轨迹 ID 和无脸持续时间；
+    # sample_fps 为分析采样率（0 表示逐帧），overlap_samples 为每个片段向前多处理的采样帧数；
+    # 同一视频、相同采样参数和模型配置的结果会被缓存，片段长度和进程数不影响结果，不参与缓存键
+    cache_key = None
+    if use_cache and RESULT_CACHE_ENABLED:
+        started = time.perf_counter()
+        params = {"sample_fps": sample_fps, "overlap_samples": overlap_samples,
+                  "danger_threshold_sec": danger_threshold_sec}
+        cache_key = result_cache.key(file_sha256(path), "offline", params)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True, "elapsed": round(time.perf_counter() - started, 3)}
+
+    fps, frame_count = probe_video(path)
+    if frame_count <= 0:
+        raise ValueError(f"无法获取视频帧数: {path}")
+    workers = workers or os.cpu_count() or 1
+    stride = max(1, round(fps / sample_fps)) if sample_fps else 1
+    segment_frames = max(stride, int(segment_seconds * fps) // stride * stride)
+    overlap = overlap_samples * stride
+
+    tasks = []
+    for segment_index in range(math.ceil(frame_count / segment_frames)):
+        start = segment_index * segment_frames
+        end = min(frame_count, start + segment_frames)
+        tasks.append((path, segment_index, max(0, start - overlap), end, stride, fps))
+
+    started = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=ctx,
+                             initializer=_init_worker, initargs=(torch_threads,)) as executor:
+        segments = dict(executor.map(_analyze_segment, tasks))
+
+    results = []
+    previous = {}
+    next_track_id = 1
+    for segment_index, task in enumerate(tasks):
+        segment_start = segment_index * segment_frames
+        emitted, next_track_id = _link_tracks(segments[segment_index], segment_start, previous, next_track_id)
+        results.extend(emitted)
+        previous = {item["frame_index"]: item for item in emitted}
+    _restitch_no_face(results, danger_threshold_sec)
+    elapsed = time.perf_counter() - started
+
+    levels = {"safe": 0, "warning": 0, "danger": 0}
+    for item in results:
+        levels[item["detection"]["overall_level"]] += 1
+    report = {
+        "video": os.path.basename(path),
+        "fps": fps,
+        "frame_count": frame_count,
+        "frames_analyzed": len(results),
+        "segments": len(tasks),
+        "workers": min(workers, len(tasks)),
+        "elapsed": round(elapsed, 3),
+        "throughput_fps": round(len(results) / elapsed, 2) if elapsed else 0,
+        "levels": levels,
+        "results": results,
+    }
+    if cache_key is not None:
+        result_cache.put(cache_key, report)
+    return {**report, "cached": False}
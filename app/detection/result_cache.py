@@ -0,0 +1,119 @@
+# detection/result_cache.py
+import functools
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from app.config import (DANGER_MODEL_PATH, FACE_MODEL_PATH, DETECTION_BACKEND, DETECTION_INT8, DETECTION_CASCADE,
+                        RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB)
+from app.utils.json_utils import json_default
+
+# 检测结果结构或后处理逻辑变化时递增，使旧缓存全部失效
+CACHE_FORMAT_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    # 分块计算文件哈希，不把整个视频读入内存
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=32)
+def _checkpoint_digest(path, size, mtime_ns):
+    # 以 (路径, 大小, 修改时间) 为键缓存权重文件哈希，权重文件被替换后自动重新计算
+    return file_sha256(path)
+
+
+def model_fingerprint():
+    # 模型权重内容 + 推理后端 / 设备 / 量化 / 级联配置的指纹，任一变化都会得到不同的缓存键；
+    # 设备与 shared_yolo 一样视为模型身份的一部分（GPU 与 CPU 的输出存在数值差异）
+    from app.detection.model_registry import default_device
+    parts = [f"v{CACHE_FORMAT_VERSION}", DETECTION_BACKEND, default_device(), str(DETECTION_INT8),
+             str(DETECTION_CASCADE)]
+    for path in (DANGER_MODEL_PATH, FACE_MODEL_PATH):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(_checkpoint_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        else:
+            parts.append(path)  # 权重尚未下载时按名称区分
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+class ResultCache:
+    # 内容寻址的分析结果缓存：键为 sha256(视频内容哈希, 分析类型, 参数, 模型指纹)，
+    # 值以 gzip 压缩的 JSON 存在磁盘上；命中时更新文件修改时间，目录超过 max_bytes 时按修改时间淘汰最久未用的条目；
+    # 离线分析通常在独立进程（etc/analyze_video.py）中使用缓存，report() 只统计磁盘上的内容
+    def __init__(self, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_MB * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def key(self, video_digest, kind, params=None):
+        payload = json.dumps({"video": video_digest, "kind": kind, "params": params or {},
+                              "model": model_fingerprint()}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None  # 不存在或文件损坏都按未命中处理
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(value, f, ensure_ascii=False, separators=(",", ":"), default=json_default)
+        os.replace(tmp_path, path)  # 原子替换，读者不会看到写了一半的文件
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json.gz"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def report(self):
+        entries = self._entries() if os.path.isdir(self.directory) else []
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "size_mb": round(sum(size for _, size, _ in entries) / 2 ** 20, 2),
+            "max_mb": round(self.max_bytes / 2 ** 20, 2),
+        }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,106 @@
+# detection/shared_ring.py
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 头部布局（int64）：[槽位数, 每槽字节数, 最新写入序号] + 每槽 [序号, 高, 宽, 通道]，之后每槽一个 float64 时间戳
+_META = 3
+_SLOT_FIELDS = 4
+_ALIGN = 64
+
+
+def _header_bytes(slots):
+    size = (_META + slots * _SLOT_FIELDS + slots) * 8
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class SharedFrameRing:
+    # 基于 multiprocessing.shared_memory 的单写多读帧环形缓冲区：解码端把帧原地写入槽位，
+    # 推理进程通过 numpy 视图零拷贝读取，队列中只传递序号；
+    # 每个槽位的序号兼作 seqlock：写入前置为 -1，写完再写入新序号，读者在使用前后各校验一次序号，
+    # 不一致说明读取期间槽位已被覆盖，该帧作废
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+        slots = int(np.ndarray((1,), dtype=np.int64, buffer=shm.buf)[0])
+        header = np.ndarray((_META + slots * _SLOT_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.slots = slots
+        self.slot_bytes = int(header[1])
+        self._meta = header[:_META]
+        self._slot_meta = header[_META:_META + self.slots * _SLOT_FIELDS].reshape(self.slots, _SLOT_FIELDS)
+        self._timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf,
+                                      offset=(_META + self.slots * _SLOT_FIELDS) * 8)
+        self._data = np.ndarray((self.slots, self.slot_bytes), dtype=np.uint8, buffer=shm.buf,
+                                offset=_header_bytes(self.slots))
+
+    @classmethod
+    def create(cls, frame_shape, slots=8):
+        slot_bytes = int(np.prod(frame_shape))  # uint8 帧
+        shm = shared_memory.SharedMemory(create=True, size=_header_bytes(slots) + slots * slot_bytes)
+        header = np.ndarray((_META + slots * _SLOT_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[0], header[1], header[2] = slots, slot_bytes, -1
+        header[_META:].reshape(slots, _SLOT_FIELDS)[:, 0] = -1
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    # 仅供唯一的写入方调用，返回该帧的序号
+    def write(self, frame, timestamp=0.0):
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"帧大小 {frame.shape} 超出槽位容量 {self.slot_bytes} 字节")
+        seq = int(self._meta[2]) + 1
+        slot = seq % self.slots
+        meta = self._slot_meta[slot]
+        meta[0] = -1  # 写入中，读者校验失败
+        self._data[slot, :frame.nbytes] = frame.reshape(-1)
+        height, width = frame.shape[:2]
+        meta[1], meta[2], meta[3] = height, width, frame.shape[2] if frame.ndim == 3 else 1
+        self._timestamps[slot] = timestamp
+        meta[0] = seq
+        self._meta[2] = seq
+        return seq
+
+    def fits(self, frame):
+        return frame.nbytes <= self.slot_bytes
+
+    def latest_seq(self):
+        return int(self._meta[2])
+
+    # 返回 (帧视图, 时间戳)，视图直接指向共享内存；槽位已被覆盖或尚未写入时返回 None
+    def read(self, seq):
+        slot = seq % self.slots
+        meta = self._slot_meta[slot]
+        if meta[0] != seq:
+            return None
+        height, width, channels = (int(v) for v in meta[1:])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        view = self._data[slot, :height * width * channels].reshape(shape)
+        timestamp = float(self._timestamps[slot])
+        if meta[0] != seq:
+            return None
+        return view, timestamp
+
+    # 使用完视图后调用：返回 False 表示使用期间槽位被写入方覆盖，基于该视图的结果不可信
+    def is_valid(self, seq):
+        return self._slot_meta[seq % self.slots][0] == seq
+
+    def read_copy(self, seq):
+        entry = self.read(seq)
+        if entry is None:
+            return None
+        frame = entry[0].copy()
+        return (frame, entry[1]) if self.is_valid(seq) else None
+
+    def close(self):
+        # 先释放所有指向共享内存的视图，否则 SharedMemory.close 会因缓冲区仍被引用而失败；
+        # 调用方持有的 read() 视图同样需要先释放
+        self._meta = self._slot_meta = self._timestamps = self._data = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
@@ -1,111 +1,175 @@
 # sort.py: Simple Online and Realtime Tracker (SORT)
 import numpy as np
 from scipy.optimize import linear_sum_assignment
-from filterpy.kalman import KalmanFilter
 
 
-def iou(bb_test, bb_gt):
-    # 计算 IOU（Intersection Over Union）用于目标匹配
-    xx1 = np.maximum(bb_test[0], bb_gt[0])
-    yy1 = np.maximum(bb_test[1], bb_gt[1])
-    xx2 = np.minimum(bb_test[2], bb_gt[2])
-    yy2 = np.minimum(bb_test[3], bb_gt[3])
+def iou_batch(bb_test, bb_gt):
+    # 向量化计算两组框两两之间的 IOU，返回 (len(bb_test), len(bb_gt)) 矩阵
+    bb_test = np.expand_dims(bb_test[:, :4], 1)
+    bb_gt = np.expand_dims(bb_gt[:, :4], 0)
+    xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
+    yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
+    xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
+    yy2 = np.minimum(bb_test[..., 3], bb_gt[..., 3])
     w = np.maximum(0., xx2 - xx1)
     h = np.maximum(0., yy2 - yy1)
     wh = w * h
-    o = wh / ((bb_test[2] - bb_test[0]) * (bb_test[3] - bb_test[1]) +
-              (bb_gt[2] - bb_gt[0]) * (bb_gt[3] - bb_gt[1]) - wh)
-    return o
-
-
-class KalmanBoxTracker:
-    # 目标跟踪的卡尔曼滤波器
-    count = 0
-
-    def __init__(self, bbox):
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array([[1, 0, 0, 0, 1, 0, 0],
-                              [0, 1, 0, 0, 0, 1, 0],
-                              [0, 0, 1, 0, 0, 0, 1],
-                              [0, 0, 0, 1, 0, 0, 0],
-                              [0, 0, 0, 0, 1, 0, 0],
-                              [0, 0, 0, 0, 0, 1, 0],
-                              [0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array([[1, 0, 0, 0, 0, 0, 0],
-                              [0, 1, 0, 0, 0, 0, 0],
-                              [0, 0, 1, 0, 0, 0, 0],
-                              [0, 0, 0, 1, 0, 0, 0]])
-        self.kf.R[2:, 2:] *= 10.
-        self.kf.P[4:, 4:] *= 1000.
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
-        self.kf.x[:4] = np.expand_dims(bbox, axis=0).T
-        self.time_since_update = 0
-        self.id = KalmanBoxTracker.count
-        KalmanBoxTracker.count += 1
-
-    def update(self, bbox):
-        self.time_since_update = 0
-        self.kf.update(bbox)
+    union = ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1]) +
+             (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)
+    # 面积为 0 的退化框 IOU 记为 0，避免除零产生 NaN
+    return np.where(union > 0, wh / np.maximum(union, 1e-9), 0.)
+
+
+class BatchKalmanFilter:
+    # 结构数组（SoA）形式的卡尔曼滤波器：所有轨迹的状态 (N, 7) 和协方差 (N, 7, 7) 堆叠存放，
+    # predict / update 用批量矩阵运算一次处理全部轨迹；模型参数与原先逐轨迹的 filterpy 实现完全一致
+    F = np.array([[1, 0, 0, 0, 1, 0, 0],
+                  [0, 1, 0, 0, 0, 1, 0],
+                  [0, 0, 1, 0, 0, 0, 1],
+                  [0, 0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 1, 0, 0],
+                  [0, 0, 0, 0, 0, 1, 0],
+                  [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+    H = np.eye(4, 7)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self):
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, bboxes):
+        bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        x = np.zeros((len(bboxes), 7))
+        x[:, :4] = bboxes
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (len(bboxes), 7, 7))))
 
     def predict(self):
-        if (self.kf.x[6] + self.kf.x[2]) <= 0:
-            self.kf.x[6] *= 0.0
-        self.kf.predict()
-        return self.kf.x[:4].flatten()
+        self.x[self.x[:, 6] + self.x[:, 2] <= 0, 6] = 0.0
+        self.x = self.x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return self.x[:, :4]
+
+    # 用观测 bboxes (K, 4) 更新 indices 指定的 K 条轨迹（Joseph 形式，与 filterpy 一致）
+    def update(self, indices, bboxes):
+        if len(indices) == 0:
+            return
+        x, P = self.x[indices], self.P[indices]
+        y = np.asarray(bboxes, dtype=float).reshape(-1, 4) - x @ self.H.T
+        PHT = P @ self.H.T
+        S = self.H @ PHT + self.R
+        K = PHT @ np.linalg.inv(S)
+        x = x + np.einsum("nij,nj->ni", K, y)
+        I_KH = np.eye(7) - K @ self.H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+        self.x[indices], self.P[indices] = x, P
+
+    def keep(self, mask):
+        self.x, self.P = self.x[mask], self.P[mask]
 
     def get_state(self):
-        return self.kf.x[:4].flatten()
+        return self.x[:, :4]
 
 
 class Sort:
-    # SORT 目标跟踪器
+    # SORT 目标跟踪器：全部轨迹保存在 BatchKalmanFilter 和并列的元数据数组中
 
     def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
-        self.trackers = []
         self.frame_count = 0
-
-    def update(self, dets):
+        self.det_track_ids = np.empty((0,), dtype=int)
+
+        self.kf = BatchKalmanFilter()
+        self.ids = np.empty((0,), dtype=int)
+        self.time_since_update = np.empty((0,), dtype=int)
+        self.hits = np.empty((0,), dtype=int)
+        self.hit_streak = np.empty((0,), dtype=int)
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    # 每帧调用一次，dets 为该帧全部检测 [[x1, y1, x2, y2, score], ...]；
+    # 返回本帧已确认轨迹 [[x1, y1, x2, y2, track_id], ...]，
+    # 同时 self.det_track_ids 记录每个检测对应的轨迹 ID（与 dets 行一一对应）
+    def update(self, dets=np.empty((0, 5))):
         self.frame_count += 1
-        ret = []
-        if len(self.trackers) == 0:
-            for i in range(len(dets)):
-                self.trackers.append(KalmanBoxTracker(dets[i, :4]))
-
-        matches, unmatched_dets, unmatched_trks = self.associate_detections_to_trackers(dets, self.trackers)
-
-        for m in matches:
-            self.trackers[m[1]].update(dets[m[0], :4])
-
-        for i in unmatched_dets:
-            self.trackers.append(KalmanBoxTracker(dets[i, :4]))
-
-        for t in reversed(range(len(self.trackers))):
-            pos = self.trackers[t].predict()
-            if self.trackers[t].time_since_update > self.max_age:
-                del self.trackers[t]
-            else:
-                ret.append(np.concatenate((pos, [self.trackers[t].id + 1])).reshape(1, -1))
-
-        if len(ret) > 0:
-            return np.concatenate(ret)
-        return np.empty((0, 5))
-
-    def associate_detections_to_trackers(self, dets, trackers):
+        dets = np.asarray(dets, dtype=float)
+        if dets.size == 0:
+            dets = np.empty((0, 5))
+
+        # 先把所有轨迹预测到当前帧
+        trks = self.kf.predict()
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += 1
+        valid = ~np.any(np.isnan(trks), axis=1)
+        if not valid.all():
+            self._keep(valid)
+            trks = self.kf.get_state()
+
+        matches, unmatched_dets, unmatched_trks = self.associate_detections_to_trackers(dets, trks)
+
+        det_track_ids = np.zeros(len(dets), dtype=int)
+        if len(matches):
+            det_idx, trk_idx = matches[:, 0], matches[:, 1]
+            self.kf.update(trk_idx, dets[det_idx, :4])
+            self.time_since_update[trk_idx] = 0
+            self.hits[trk_idx] += 1
+            self.hit_streak[trk_idx] += 1
+            det_track_ids[det_idx] = self.ids[trk_idx] + 1
+
+        if len(unmatched_dets):
+            new_ids = np.arange(self.next_id, self.next_id + len(unmatched_dets))
+            self.next_id += len(unmatched_dets)
+            self.kf.add(dets[unmatched_dets, :4])
+            zeros = np.zeros(len(unmatched_dets), dtype=int)
+            self.ids = np.concatenate((self.ids, new_ids))
+            self.time_since_update = np.concatenate((self.time_since_update, zeros))
+            self.hits = np.concatenate((self.hits, zeros))
+            self.hit_streak = np.concatenate((self.hit_streak, zeros))
+            det_track_ids[unmatched_dets] = new_ids + 1
+        self.det_track_ids = det_track_ids
+
+        alive = self.time_since_update <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+
+        # 只输出本帧有匹配且已连续命中 min_hits 次的轨迹（起始阶段除外）
+        confirmed = (self.time_since_update < 1) & (
+            (self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+        if not confirmed.any():
+            return np.empty((0, 5))
+        ret = np.column_stack((self.kf.get_state()[confirmed], self.ids[confirmed] + 1))
+        return ret[::-1]
+
+    def _keep(self, mask):
+        self.kf.keep(mask)
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+
+    # trks 为所有轨迹在当前帧的预测框 (M, 4)
+    def associate_detections_to_trackers(self, dets, trks):
         # 进行目标匹配
-        if len(trackers) == 0:
-            return np.empty((0, 2), dtype=int), np.arange(len(dets)), np.empty((0, 5), dtype=int)
-        iou_matrix = np.zeros((len(dets), len(trackers)), dtype=np.float32)
-        for d, det in enumerate(dets):
-            for t, trk in enumerate(trackers):
-                iou_matrix[d, t] = iou(det[:4], trk.get_state())
-
-        matched_indices = linear_sum_assignment(-iou_matrix)
-        matched_indices = np.array(list(zip(matched_indices[0], matched_indices[1])))
-        unmatched_detections = np.delete(np.arange(len(dets)), matched_indices[:, 0])
-        unmatched_trackers = np.delete(np.arange(len(trackers)), matched_indices[:, 1])
-        return matched_indices, unmatched_detections, unmatched_trackers
+        if len(trks) == 0:
+            return np.empty((0, 2), dtype=int), np.arange(len(dets)), np.empty((0,), dtype=int)
+        if len(dets) == 0:
+            return np.empty((0, 2), dtype=int), np.empty((0,), dtype=int), np.arange(len(trks))
+
+        iou_matrix = iou_batch(dets[:, :4], trks[:, :4])
+        row_ind, col_ind = linear_sum_assignment(-iou_matrix)
+
+        # 匈牙利匹配结果中 IOU 低于阈值的不算匹配
+        keep = iou_matrix[row_ind, col_ind] >= self.iou_threshold
+        matches = np.column_stack((row_ind[keep], col_ind[keep])).astype(int)
+        unmatched_detections = np.setdiff1d(np.arange(len(dets)), matches[:, 0])
+        unmatched_trackers = np.setdiff1d(np.arange(len(trks)), matches[:, 1])
+        return matches, unmatched_detections, unmatched_trackers
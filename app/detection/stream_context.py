@@ -0,0 +1,71 @@
+# detection/stream_context.py
+import threading
+import time
+
+
+class PosePool:
+    # MediaPipe Pose 计算图池：static_image_mode=False 的 Pose 带有帧间跟踪状态且不是线程安全的，
+    # 每路流检出一个独占使用，流结束后重置并归还复用，避免为每路流重新构建计算图
+    def __init__(self, factory, max_size=None):
+        self.factory = factory
+        self.max_size = max_size
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        with self._cond:
+            while not self._idle and self.max_size is not None and self._created >= self.max_size:
+                if not self._cond.wait(timeout):
+                    raise TimeoutError("没有可用的姿态检测计算图")
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    # 归还前重置计算图，清掉上一路流的帧间跟踪状态，下一路流从空白状态开始检测；重置失败的计算图直接丢弃
+    def release(self, pose):
+        try:
+            pose.reset()
+        except Exception as e:
+            print(f"⚠️ 姿态计算图重置失败，已丢弃: {e}")
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(pose)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {"created": self._created, "idle": len(self._idle), "max_size": self.max_size}
+
+
+class StreamContext:
+    # 单路流的可变检测状态：无脸计时、目标跟踪器、独占的 Pose 计算图；
+    # YOLO 模型等重量级资源仍由 MultiDetector 在所有流之间共享
+    def __init__(self, stream_id, tracker, pose_pool):
+        self.stream_id = stream_id
+        self.tracker = tracker
+        self.no_face_start_time = None  # 开始没有检测到脸的时间
+        self.clock = time.time  # 无脸计时使用的时钟，离线分析时替换为视频内的时间戳
+        self._pose_pool = pose_pool
+        self.pose = pose_pool.acquire()
+
+    def close(self):
+        if self.pose is not None:
+            self._pose_pool.release(self.pose)
+            self.pose = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
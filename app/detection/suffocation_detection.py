@@ -1,38 +1,92 @@
 import time
-from ultralytics import YOLO
-import torch
+import numpy as np
+from app.config import FACE_MODEL_PATH, NO_FACE_DANGER_SEC
+from app.detection.model_registry import shared_detector_model
+from app.detection.frame_packet import FramePacket
+
+
+# 人脸模型中人脸的类别 ID
+FACE_CLS_ID = 0
 
 
 class SuffocationDetector:
-    def __init__(self, model_path="best_WIDER.pt", device=None):
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = YOLO(model_path).to(self.device)
-        self.no_face_start_time = None  # 开始没有检测到脸的时间
-        self.danger_threshold_sec = 10  # 设置为 10 秒
+    def __init__(self, model_path=FACE_MODEL_PATH, device=None, backend=None, int8=None):
+        self.model_entry, self.device, self.backend = shared_detector_model(model_path, device, backend, int8)
+        self.model = self.model_entry.model
+        self._lock = self.model_entry.lock
+        self.no_face_start_time = None  # 开始没有检测到脸的时间（未传入 StreamContext 时使用）
+        self.danger_threshold_sec = NO_FACE_DANGER_SEC
+        self.clock = time.time  # 未传入 StreamContext 时无脸计时使用的时钟
 
-    def detect(self, frame):
-        results = self.model(frame)
-        suffocations = []
+    # frame 可以是原始 BGR 帧，也可以是共享预处理结果的 FramePacket；
+    # rois 为 [(x1, y1, x2, y2), ...] 时只在这些区域内检测人脸（级联模式），坐标映射回整帧；
+    # context 为该路流的 StreamContext，无脸计时记录在其中
+    def detect(self, frame, rois=None, context=None):
+        packet = FramePacket.wrap(frame)
+        state = context if context is not None else self
+        if rois:
+            return self._finish(self._detect_faces_in_rois(packet, rois), state)
+        with self._lock:
+            results = self.model(packet.frame, classes=[FACE_CLS_ID])
+        return self._finish(self._faces_from_results(results), state)
 
-        faces_detected = 0
+    # 多帧批量检测：人脸模型整批只跑一次前向，无脸计时按帧顺序推进；contexts 与 frames 一一对应
+    def detect_batch(self, frames, contexts=None):
+        packets = [FramePacket.wrap(frame) for frame in frames]
+        if not packets:
+            return []
+        states = list(contexts) if contexts else [self] * len(packets)
+        with self._lock:
+            results = self.model([packet.frame for packet in packets], classes=[FACE_CLS_ID], batch=len(packets))
+        return [self._finish(self._faces_from_results([result]), state)
+                for result, state in zip(results, states)]
+
+    def _faces_from_results(self, results):
+        faces = []
         for result in results:
-            for box in result.boxes:
-                cls_id = int(box.cls.item())
-                if cls_id == 0:  # 假设 0 是人脸类别
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                    suffocations.append({
-                        "bbox": (x1, y1, x2, y2),
-                        "confidence": float(box.conf.item()),
-                        "level": "safe"
-                    })
-                    faces_detected += 1
-
-        current_time = time.time()
+            faces.extend(self._face_entries(result, result.boxes.xyxy.cpu().numpy()))
+        return faces
+
+    def _detect_faces_in_rois(self, packet, rois):
+        crops = [packet.frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rois]
+        # 输入尺寸按最大裁剪区域取 32 的倍数，小区域不再放大到 640 推理
+        longest = max(max(crop.shape[:2]) for crop in crops)
+        imgsz = int(min(640, max(160, int(np.ceil(longest / 32)) * 32)))
+        with self._lock:
+            results = self.model(crops, imgsz=imgsz, classes=[FACE_CLS_ID], batch=len(crops))
+
+        faces = []
+        for result, (x1, y1, _, _) in zip(results, rois):
+            boxes_xyxy = result.boxes.xyxy.cpu().numpy() + np.array([x1, y1, x1, y1], dtype=np.float32)
+            faces.extend(self._face_entries(result, boxes_xyxy))
+        return faces
+
+    def _face_entries(self, result, boxes_xyxy):
+        boxes = result.boxes
+        if len(boxes) == 0:
+            return []
+        # 一次性取出 conf / cls，避免逐框 .item() 同步
+        is_face = boxes.cls.cpu().numpy().astype(int) == FACE_CLS_ID  # 假设 0 是人脸类别
+        confs = boxes.conf.cpu().numpy()[is_face].tolist()
+        bboxes = np.asarray(boxes_xyxy).astype(int)[is_face].tolist()
+        return [
+            {
+                "bbox": tuple(bbox),
+                "confidence": confidence,
+                "level": "safe"
+            }
+            for bbox, confidence in zip(bboxes, confs)
+        ]
+
+    # state 为持有 no_face_start_time 与 clock 的对象：StreamContext 或检测器自身
+    def _finish(self, suffocations, state):
+        faces_detected = len(suffocations)
+        current_time = state.clock()
 
         if faces_detected == 0:
-            if self.no_face_start_time is None:
-                self.no_face_start_time = current_time  # 记录开始无脸的时间
-            duration = current_time - self.no_face_start_time
+            if state.no_face_start_time is None:
+                state.no_face_start_time = current_time  # 记录开始无脸的时间
+            duration = current_time - state.no_face_start_time
             level = "danger" if duration >= self.danger_threshold_sec else "warning"
             suffocations.append({
                 "bbox": None,
@@ -41,6 +95,6 @@ class SuffocationDetector:
                 "duration": round(duration, 2)
             })
         else:
-            self.no_face_start_time = None  # 重置定时器
+            state.no_face_start_time = None  # 重置定时器
 
         return suffocations
@@ -1,19 +1,66 @@
+import importlib
+
 from fastapi import FastAPI
-from .api import auth, device, notification, websocket, video, timing
+from .config import APP_ROLE, ROLE_ROUTERS, INFERENCE_WORKERS
 from .utils.database import Base, engine
 
 # tags是用于自动文档（Swagger UI）的分组显示
 
+if APP_ROLE not in ROLE_ROUTERS:
+    raise ValueError(f"未知的 APP_ROLE: {APP_ROLE}，可选值: {', '.join(ROLE_ROUTERS)}")
+
 # 生成数据库表
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
 
+# 路由名 -> (前缀, tags)；只导入当前角色需要的路由模块，api 角色不会加载检测栈
+ROUTERS = {
+    "auth": ("/auth", ["Auth"]),
+    "device": ("/device", ["Device"]),
+    "notification": ("/notification", ["Notification"]),
+    "websocket": ("/ws", ["WebSocket"]),
+    "video": ("/video", ["Video"]),
+    # timing仅供测试
+    "timing": ("/timing", ["Timing"]),
+}
+
 # 注册路由
-app.include_router(auth.router, prefix="/auth", tags=["Auth"])
-app.include_router(device.router, prefix="/device", tags=["Device"])
-app.include_router(notification.router, prefix="/notification", tags=["Notification"])
-app.include_router(websocket.router, prefix="/ws", tags=["WebSocket"])
-app.include_router(video.router, prefix="/video", tags=["Video"])
-# timing仅供测试
-app.include_router(timing.router, prefix="/timing", tags=["Timing"])
+for name in ROLE_ROUTERS[APP_ROLE]:
+    prefix, tags = ROUTERS[name]
+    module = importlib.import_module(f".api.{name}", __package__)
+    app.include_router(module.router, prefix=prefix, tags=tags)
+
+
+@app.on_event("startup")
+async def start_alert_bridge():
+    # 在服务器事件循环中启动告警推送通道，检测线程通过它把告警交给事件循环推送
+    if "websocket" in ROLE_ROUTERS[APP_ROLE]:
+        from .api import websocket
+        await websocket.alert_bridge.start()
+
+
+@app.on_event("startup")
+def preload_models():
+    # inference 角色启动时即加载并预热模型，首个检测请求不承担加载开销；
+    # 启用推理进程池时持续检测在子进程中运行，本进程不预加载，避免白占内存
+    if APP_ROLE == "inference":
+        from .api import video
+        if INFERENCE_WORKERS == 0:
+            video.get_multi_detector()
+
+
+@app.on_event("shutdown")
+def shutdown_inference():
+    # 关闭推理进程池，避免推理子进程残留；写完队列中尚未入库的通知
+    if "video" in ROLE_ROUTERS[APP_ROLE]:
+        from .api import video
+        video.shutdown_inference_pool()
+        video.shutdown_notification_writer()
+
+
+@app.on_event("shutdown")
+async def stop_alert_bridge():
+    if "websocket" in ROLE_ROUTERS[APP_ROLE]:
+        from .api import websocket
+        await websocket.alert_bridge.stop()
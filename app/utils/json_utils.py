@@ -0,0 +1,6 @@
+# utils/json_utils.py
+
+
+def json_default(o):
+    # json.dump 的 default：numpy 标量转为 Python 数值，其余无法序列化的对象转为字符串
+    return o.item() if hasattr(o, "item") else str(o)
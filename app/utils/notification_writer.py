@@ -0,0 +1,204 @@
+# utils/notification_writer.py
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert, text
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.crud import notification_message
+from app.models import Notification
+from app.utils.database import SessionLocal
+
+
+class NotificationWriter:
+    # 通知批量写入服务：检测线程把通知放入有界队列后立即拿到 Future，不等待数据库；
+    # 后台线程使用自己的会话，凑满 batch_size 条或距本批第一条超过 flush_interval 秒时一次写入并提交，
+    # Future 的结果为带自增 ID 的通知字典（与 Notification.to_dict 相同），用于 WebSocket 推送。
+    # 取回自增 ID 的方式按数据库能力选择：
+    #   returning   - 支持 INSERT ... RETURNING（MariaDB / PostgreSQL / SQLite），多行插入按参数顺序返回 ID
+    #   consecutive - MySQL 且 innodb_autoinc_lock_mode <= 1：单条多行 INSERT 分配的 ID 连续，由首行 ID 推算
+    #   per_row     - 其他情况逐行插入取 ID，但整批仍在一个事务中提交
+    def __init__(self, session_factory=SessionLocal, max_queue=1000, batch_size=50, flush_interval=0.2,
+                 submit_timeout=1.0):
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        self.strategy = None
+        self._autoinc_step = 1
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._flush_times = deque(maxlen=500)  # 最近若干批的写入耗时（秒）
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "written": 0, "batches": 0, "dropped": 0, "failed": 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="notification-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    # 提交一条通知，返回 concurrent.futures.Future；队列满时等待 submit_timeout 秒后放弃
+    def submit(self, notification_data, user_id):
+        row = {
+            "user_id": user_id,
+            "device_id": notification_data.device_id,
+            "level": notification_data.level,
+            "message": notification_message(notification_data.level, notification_data.message),
+            "timestamp": datetime.utcnow(),  # 以告警发生时间为准，而不是落库时间
+            "pinned": bool(notification_data.pinned),
+            "deleted": bool(notification_data.deleted),
+        }
+        future = Future()
+        if self._stop.is_set():
+            future.set_exception(RuntimeError("通知写入服务已关闭"))
+            return future
+        try:
+            self._queue.put((row, future), timeout=self.submit_timeout)
+        except queue.Full:
+            self._count("dropped")
+            future.set_exception(RuntimeError("通知队列已满，告警未能入库"))
+        else:
+            self._count("submitted")
+        return future
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        session = self.session_factory()
+        try:
+            # 关闭后继续写完队列中剩余的通知再退出
+            while not (self._stop.is_set() and self._queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    self._flush(session, batch)
+        finally:
+            session.close()
+
+    def _flush(self, session, batch):
+        rows = [row for row, _ in batch]
+        start = time.perf_counter()
+        try:
+            results = list(zip(batch, self._insert(session, rows)))
+            session.commit()
+        except (IntegrityError, DataError) as e:
+            # 某一行数据有问题（如外键不存在）时整批回滚，再逐行写入，只让出错的那一行失败
+            session.rollback()
+            print(f"⚠️ 通知批量写入失败，改为逐行写入（{len(rows)} 条）: {e}")
+            try:
+                results = self._insert_each(session, batch)
+                session.commit()
+            except Exception as e:
+                self._fail(session, batch, e)
+                return
+        except Exception as e:
+            self._fail(session, batch, e)
+            return
+        self._flush_times.append(time.perf_counter() - start)
+        self._count("batches")
+
+        for (row, future), notification_id in results:
+            if isinstance(notification_id, Exception):
+                self._count("failed")
+                future.set_exception(notification_id)
+            else:
+                self._count("written")
+                future.set_result({"id": notification_id, **row, "timestamp": row["timestamp"].isoformat()})
+
+    def _insert_each(self, session, batch):
+        # 每行一个 SAVEPOINT，出错的行回滚到保存点并记下异常，其余行照常写入
+        results = []
+        for row, future in batch:
+            try:
+                with session.begin_nested():
+                    notification_id = self._insert(session, [row])[0]
+            except (IntegrityError, DataError) as e:
+                print(f"❌ 通知写入失败: {e.orig}")
+                notification_id = e
+            results.append(((row, future), notification_id))
+        return results
+
+    def _fail(self, session, batch, error):
+        session.rollback()
+        print(f"❌ 通知批量写入失败（{len(batch)} 条）: {error}")
+        self._count("failed", len(batch))
+        for _, future in batch:
+            future.set_exception(error)
+
+    def _insert(self, session, rows):
+        if self.strategy is None:
+            self.strategy = self._detect_strategy(session)
+
+        if self.strategy == "returning":
+            result = session.execute(insert(Notification).returning(Notification.id, sort_by_parameter_order=True),
+                                     rows)
+            return list(result.scalars())
+        if self.strategy == "consecutive":
+            # 多行 INSERT 后 LAST_INSERT_ID() 为本语句第一行的 ID，其余按 auto_increment_increment 递增
+            result = session.execute(insert(Notification).values(rows))
+            first = result.lastrowid
+            return [first + i * self._autoinc_step for i in range(len(rows))]
+
+        notifications = [Notification(**row) for row in rows]
+        session.add_all(notifications)
+        session.flush()
+        return [n.id for n in notifications]
+
+    def _detect_strategy(self, session):
+        connection = session.connection()  # 连接建立后方言才能确定服务端能力（如 MariaDB 的 RETURNING）
+        dialect = connection.dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            return "returning"
+        if dialect.name == "mysql":
+            lock_mode, step = connection.execute(
+                text("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")).one()
+            if int(lock_mode) <= 1:
+                self._autoinc_step = int(step)
+                return "consecutive"
+        return "per_row"
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        flush_ms = np.array(self._flush_times) * 1000
+        return {
+            "strategy": self.strategy,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            **counters,
+            "avg_batch_size": round(counters["written"] / counters["batches"], 2) if counters["batches"] else 0,
+            "flush_p50_ms": round(float(np.percentile(flush_ms, 50)), 3) if len(flush_ms) else None,
+            "flush_p95_ms": round(float(np.percentile(flush_ms, 95)), 3) if len(flush_ms) else None,
+            "flush_max_ms": round(float(flush_ms.max()), 3) if len(flush_ms) else None,
+        }
+
+    def shutdown(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
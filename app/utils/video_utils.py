@@ -1,10 +1,32 @@
-from datetime import time
+import collections
+import functools
+import re
+import subprocess
+import threading
+import time
 
 import cv2
+import numpy as np
 
+from app.config import (VIDEO_CAPTURE_BACKEND, FFMPEG_PATH, FFMPEG_DECODE_FPS, FFMPEG_DECODE_WIDTH,
+                        FFMPEG_IO_TIMEOUT)
 
-def get_video_capture(source: str):
-    cap = cv2.VideoCapture(source)
+
+# backend 为 opencv / ffmpeg，默认取 VIDEO_CAPTURE_BACKEND；其余参数传给 FFmpegCapture
+def get_video_capture(source: str, backend=None, **kwargs):
+    backend = backend or VIDEO_CAPTURE_BACKEND
+    if backend == "ffmpeg":
+        cap = FFmpegCapture(source, **kwargs)
+    elif backend == "opencv":
+        if "://" in source and FFMPEG_IO_TIMEOUT:
+            # 网络源设置打开 / 读取超时，流停滞时 read() 返回失败而不是一直阻塞
+            timeout_ms = int(FFMPEG_IO_TIMEOUT * 1000)
+            cap = cv2.VideoCapture(source, cv2.CAP_ANY, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+                                                         cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
+        else:
+            cap = cv2.VideoCapture(source)
+    else:
+        raise ValueError(f"未知的视频采集后端: {backend}")
 
     if not cap.isOpened():
         raise ValueError(f"无法打开视频源: {source}")
@@ -12,13 +34,298 @@ def get_video_capture(source: str):
     return cap
 
 
-# min_interval = 0.2 表示每秒抽取 5 帧
-def read_frame(cap, min_interval=0.2, last_time=[0]):
-    now = time.time()
-    if now - last_time[0] < min_interval:
-        return None
-    ret, frame = cap.read()
-    if not ret:
+# rtsp 解复用器的 socket 超时选项随 ffmpeg 版本变化：4.x 为 -stimeout（微秒），-timeout 是 listen_timeout 的
+# 旧别名（秒，并把 rtsp 切换为服务端监听模式）；5.0 起 -stimeout 被移除，-timeout 改为 socket 超时（微秒）。
+# 解析一次 `ffmpeg -h demuxer=rtsp` 确定应使用的选项，无法确定时返回 None，不设置该超时
+@functools.lru_cache(maxsize=None)
+def rtsp_timeout_option(ffmpeg):
+    try:
+        output = subprocess.run([ffmpeg, "-hide_banner", "-h", "demuxer=rtsp"], capture_output=True,
+                                timeout=10).stdout.decode("utf-8", "replace")
+    except (OSError, subprocess.SubprocessError):
         return None
-    last_time[0] = now
-    return frame
+    options = {}
+    for line in output.splitlines():
+        match = re.match(r"\s*(-\w+)\s", line)
+        if match:
+            options[match.group(1)] = line
+    if "-stimeout" in options:
+        return "-stimeout"
+    if "microseconds" in options.get("-timeout", ""):
+        return "-timeout"
+    return None
+
+
+class FFmpegCapture:
+    # ffmpeg 子进程解码：fps / scale 滤镜在解码端完成抽帧和缩放，原始 BGR 帧从 stdout 读入复用的缓冲区，
+    # 被丢弃的帧不再做全分辨率颜色转换和拷贝；接口与 cv2.VideoCapture 一致（isOpened / read / get / release），
+    # read 返回的帧会在下一次 read 时被覆盖，需要保留时由调用方拷贝
+    reuses_buffer = True
+    # release() 可以在其他线程调用，用于打断阻塞中的 read()
+    interruptible = True
+    # 从 ffmpeg 输出流信息中解析缩放后的帧尺寸，如 "Video: rawvideo (BGR[24] / 0x18524742), bgr24, 640x360"
+    _SIZE_PATTERN = re.compile(r"Video: rawvideo.*?, (\d+)x(\d+)[ ,\[]")
+
+    def __init__(self, source, fps=None, width=None, ffmpeg=None, open_timeout=10.0, io_timeout=None):
+        self.source = source
+        self.fps = FFMPEG_DECODE_FPS if fps is None else fps
+        self.width = FFMPEG_DECODE_WIDTH if width is None else width
+        self.height = 0
+        self.frames = 0
+        self.log = collections.deque(maxlen=20)  # 最近的 ffmpeg 日志，便于排查连接失败
+
+        filters = []
+        if self.fps:
+            filters.append(f"fps={self.fps:g}")
+        if self.width:
+            filters.append(f"scale={self.width}:-2")  # 高度按比例缩放并取偶数
+
+        ffmpeg = ffmpeg or FFMPEG_PATH
+        cmd = [ffmpeg, "-nostdin", "-hide_banner", "-nostats", "-loglevel", "info"]
+        io_timeout = FFMPEG_IO_TIMEOUT if io_timeout is None else io_timeout
+        if source.startswith("rtsp://"):
+            cmd += ["-rtsp_transport", "tcp"]
+            timeout_option = rtsp_timeout_option(ffmpeg) if io_timeout else None
+            if timeout_option:
+                cmd += [timeout_option, str(int(io_timeout * 1e6))]  # rtsp 解复用器自身的 socket 超时
+        elif "://" in source and not source.startswith("file:") and io_timeout:
+            # 其他网络源的读写超时（微秒），rtsp 解复用器不接受该选项：流停滞时 ffmpeg 报错退出，read() 随之返回失败
+            cmd += ["-rw_timeout", str(int(io_timeout * 1e6))]
+        cmd += ["-i", source, "-an"]
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        cmd += ["-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+
+        self._buffer = None
+        self._view = None
+        self._size_found = threading.Event()
+        try:
+            self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except FileNotFoundError:
+            self._process = None
+            self.log.append(f"未找到 ffmpeg: {cmd[0]}")
+            return
+
+        threading.Thread(target=self._drain_stderr, name=f"ffmpeg-log-{source}", daemon=True).start()
+        self._size_found.wait(open_timeout)
+        if self.height:
+            self._buffer = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            self._view = memoryview(self._buffer).cast("B")
+        else:
+            self.release()
+
+    # 持续读取 stderr，避免管道写满阻塞 ffmpeg；首次出现输出流信息时记录帧尺寸
+    def _drain_stderr(self):
+        for raw in iter(self._process.stderr.readline, b""):
+            line = raw.decode("utf-8", "replace").rstrip()
+            self.log.append(line)
+            if not self._size_found.is_set():
+                match = self._SIZE_PATTERN.search(line)
+                if match:
+                    self.width, self.height = int(match.group(1)), int(match.group(2))
+                    self._size_found.set()
+        self._size_found.set()
+
+    def isOpened(self):
+        return self._buffer is not None
+
+    def read(self):
+        # 取局部引用：其他线程 release() 杀掉进程后，这里的 readinto 读到 EOF 返回失败
+        buffer, view = self._buffer, self._view
+        if buffer is None:
+            return False, None
+        stdout = self._process.stdout
+        received = 0
+        try:
+            while received < len(view):
+                count = stdout.readinto(view[received:])
+                if not count:
+                    return False, None
+                received += count
+        except (OSError, ValueError):
+            return False, None
+        self.frames += 1
+        return True, buffer
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    # 可在其他线程调用：先杀掉 ffmpeg，阻塞在 read() 中的线程随即读到 EOF
+    def release(self):
+        self._buffer = None
+        self._view = None
+        process = self._process
+        if process is None:
+            return
+        if process.poll() is None:
+            process.kill()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ ffmpeg 进程 {process.pid} 未能退出: {self.source}")
+            return
+        process.stdout.close()
+
+
+class LatestFrameReader:
+    # 每路流一个采集线程：持续从视频源读取解码，只保留最新一帧，推理跟不上时旧帧直接丢弃，
+    # 检测线程拿到的总是最新画面而不是积压在缓冲区里几秒前的帧；读取失败时按指数退避重连。
+    # read() 与 cv2.VideoCapture 接口一致，可直接交给 FrameSampler 使用
+    def __init__(self, source, read_timeout=2.0, reconnect_delay=0.5, max_reconnect_delay=30.0, join_timeout=5.0):
+        self.source = source
+        self.read_timeout = read_timeout
+        self.join_timeout = join_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._cap = None  # 采集线程当前使用的视频源
+        self._frame = None
+        self._timestamp = None
+        self._seq = 0  # 已采集的帧序号
+        self._consumed_seq = 0  # 最近一次被取走的帧序号
+
+        self.last_timestamp = None  # 最近一次 read() 返回帧的采集时间
+        self.stats = {"captured": 0, "delivered": 0, "dropped": 0, "reconnects": 0, "connect_failures": 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.source}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        cap = None
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            if cap is None:
+                try:
+                    cap = self._cap = get_video_capture(self.source)
+                except Exception as e:
+                    self.stats["connect_failures"] += 1
+                    print(f"⚠️ 视频源连接失败，{delay:.1f}s 后重试: {e}")
+                    if self._stop.wait(delay):
+                        break
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+
+            ret, frame = cap.read()
+            if not ret and self._stop.is_set():
+                break  # release() 打断了读取
+            if not ret:
+                # 连续失败时退避间隔翻倍，成功读到帧后恢复初始间隔
+                print(f"⚠️ 视频源读取失败，{delay:.1f}s 后重连: {self.source}")
+                cap.release()
+                cap = self._cap = None
+                self.stats["reconnects"] += 1
+                if self._stop.wait(delay):
+                    break
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            delay = self.reconnect_delay
+
+            timestamp = time.time()
+            # 复用输出缓冲区的采集后端（如 FFmpegCapture）下一次 read 会覆盖该帧，需要拷贝
+            if getattr(cap, "reuses_buffer", False):
+                frame = frame.copy()
+            with self._cond:
+                if self._seq > self._consumed_seq:
+                    self.stats["dropped"] += 1  # 上一帧还没被取走就被覆盖
+                self._frame = frame
+                self._timestamp = timestamp
+                self._seq += 1
+                self.stats["captured"] += 1
+                self._cond.notify_all()
+
+        if cap is not None:
+            cap.release()
+        self._cap = None
+
+    # 等待一帧尚未取走过的新帧，返回 (frame, 采集时间戳)；超时或已停止时返回 None
+    def read_latest(self, timeout=None):
+        with self._cond:
+            has_frame = self._cond.wait_for(lambda: self._seq > self._consumed_seq or self._stop.is_set(),
+                                            timeout)
+            if not has_frame or self._stop.is_set():
+                return None
+            self._consumed_seq = self._seq
+            self.stats["delivered"] += 1
+            return self._frame, self._timestamp
+
+    def read(self):
+        latest = self.read_latest(self.read_timeout)
+        if latest is None:
+            return False, None
+        frame, self.last_timestamp = latest
+        return True, frame
+
+    def isOpened(self):
+        return not self._stop.is_set()
+
+    # 采集线程可能正阻塞在 read() 中：支持跨线程释放的后端（FFmpegCapture）先直接关闭以打断读取，
+    # cv2.VideoCapture 依靠读取超时返回；等待超过 join_timeout 时不再阻塞调用方
+    def release(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        cap = self._cap
+        if cap is not None and getattr(cap, "interruptible", False):
+            cap.release()
+        if self._thread is not None:
+            self._thread.join(self.join_timeout)
+            if self._thread.is_alive():
+                print(f"⚠️ 采集线程 {self.join_timeout:.0f}s 内未退出，视频源可能卡在读取中: {self.source}")
+            self._thread = None
+
+
+class FrameSampler:
+    # 每路流独立的抽帧调度器：上一帧结果为 warning / danger 时立即提高采样率，
+    # 安全时按 decay 逐步回落到 safe_fps；两次采样之间精确睡眠，不再空转轮询
+    def __init__(self, safe_fps=2.0, warning_fps=5.0, danger_fps=10.0, decay=0.8):
+        self.level_fps = {"safe": safe_fps, "warning": warning_fps, "danger": danger_fps}
+        self.decay = decay
+        self.fps = warning_fps
+        self.last_sample_time = None
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+    # 根据最新的 overall_level 调整目标采样率
+    def update(self, level):
+        target = self.level_fps.get(level, self.level_fps["safe"])
+        if target >= self.fps:
+            self.fps = target
+        else:
+            self.fps = target + (self.fps - target) * self.decay
+
+    # 睡眠到下一次采样时刻；stop_event 被设置时提前返回 False
+    def wait(self, stop_event=None):
+        now = time.monotonic()
+        if self.last_sample_time is not None:
+            delay = self.last_sample_time + self.interval - now
+            if delay > 0:
+                if stop_event is not None:
+                    if stop_event.wait(delay):
+                        return False
+                else:
+                    time.sleep(delay)
+        elif stop_event is not None and stop_event.is_set():
+            return False
+        self.last_sample_time = time.monotonic()
+        return True
+
+    def read(self, cap, stop_event=None):
+        if not self.wait(stop_event):
+            return None
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        return frame
@@ -0,0 +1,35 @@
+# 长录像离线分析：按片段并行检测并拼接逐帧结果，输出各等级帧数与吞吐；--output 写出完整逐帧结果 JSON
+# 用法: python etc/analyze_video.py recording.mp4 --workers 8 --segment-seconds 60 --sample-fps 5 --output result.json
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.detection.offline import analyze_video  # noqa: E402
+from app.utils.json_utils import json_default  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--segment-seconds", type=float, default=60.0)
+    parser.add_argument("--sample-fps", type=float, default=5.0, help="分析采样率，0 表示逐帧")
+    parser.add_argument("--torch-threads", type=int, default=1, help="每个进程的 torch 线程数")
+    parser.add_argument("--no-cache", action="store_true", help="忽略结果缓存，强制重新分析")
+    parser.add_argument("--output", help="逐帧结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    report = analyze_video(args.video, workers=args.workers, segment_seconds=args.segment_seconds,
+                           sample_fps=args.sample_fps, torch_threads=args.torch_threads,
+                           use_cache=not args.no_cache)
+    print(f"{report['video']}: {report['frames_analyzed']} frames in {report['segments']} segments, "
+          f"{report['workers']} workers, {report['elapsed']}s ({report['throughput_fps']} fps)"
+          f"{' [cached]' if report['cached'] else ''}")
+    print(f"levels: {report['levels']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, default=json_default)
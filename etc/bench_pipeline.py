@@ -0,0 +1,37 @@
+# 检测流水线分阶段基准：decode / preprocess / danger / tracker / face / pose / aggregation 的 p50 / p95 / p99，
+# 以及吞吐和峰值内存；--output 写出 JSON，便于不同版本之间 diff
+# 用法: python etc/bench_pipeline.py --frames 100 --size 1280x720 --iterations 3 --output bench.json
+#       python etc/bench_pipeline.py --video sample.mp4
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.detection.benchmark import run_benchmark  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", help="使用指定视频，缺省时生成合成视频")
+    parser.add_argument("--frames", type=int, default=100, help="合成视频帧数")
+    parser.add_argument("--size", default="640x480", help="合成视频尺寸，如 1280x720")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=5, help="不计入统计的预热帧数")
+    parser.add_argument("--output", help="JSON 结果输出路径")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    report = run_benchmark(args.video, frames=args.frames, size=(width, height),
+                           iterations=args.iterations, warmup_frames=args.warmup)
+
+    print(f"{'stage':<12}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<12}{row['count']:>7}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+              f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+    print(f"throughput: {report['throughput_fps']} fps, peak RSS: {report['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,107 @@
+# 解码进程 -> 推理进程的帧传递吞吐对比：pickle 整帧的 multiprocessing.Queue 与 SharedFrameRing（队列中只传序号）
+# 用法: python etc/bench_shared_ring.py --sizes 640x480 1280x720 1920x1080 --frames 300
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.detection.shared_ring import SharedFrameRing  # noqa: E402
+
+
+def touch(frame):
+    # 模拟推理进程读取整帧（如 letterbox 缩放），保证两种方式都真正访问了帧数据
+    return int(frame[::8, ::8].sum())
+
+
+def queue_reader(task_queue, result_queue):
+    latencies = []
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        sent, frame = task
+        touch(frame)
+        latencies.append(time.perf_counter() - sent)
+    result_queue.put((latencies, 0))
+
+
+def ring_reader(ring_name, task_queue, result_queue):
+    ring = SharedFrameRing.attach(ring_name)
+    latencies, torn = [], 0
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        sent, seq = task
+        entry = ring.read(seq)
+        if entry is None:
+            torn += 1
+            continue
+        touch(entry[0])
+        del entry
+        if not ring.is_valid(seq):
+            torn += 1
+            continue
+        latencies.append(time.perf_counter() - sent)
+    ring.close()
+    result_queue.put((latencies, torn))
+
+
+def run(mode, shape, frames, depth):
+    ctx = multiprocessing.get_context("spawn")
+    task_queue = ctx.Queue(maxsize=depth)
+    result_queue = ctx.Queue()
+    frame = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+
+    ring = None
+    if mode == "ring":
+        # 槽位比队列容量多 2，写入方不会覆盖仍在排队的帧
+        ring = SharedFrameRing.create(shape, slots=depth + 2)
+        process = ctx.Process(target=ring_reader, args=(ring.name, task_queue, result_queue))
+    else:
+        process = ctx.Process(target=queue_reader, args=(task_queue, result_queue))
+    process.start()
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        if ring is not None:
+            seq = ring.write(frame)
+            task_queue.put((time.perf_counter(), seq))
+        else:
+            task_queue.put((time.perf_counter(), frame))
+    task_queue.put(None)
+    latencies, torn = result_queue.get()
+    elapsed = time.perf_counter() - start
+    process.join()
+    if ring is not None:
+        ring.close()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "fps": frames / elapsed,
+        "mb_per_s": frames * frame.nbytes / elapsed / 2 ** 20,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "torn": torn,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x720", "1920x1080"])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--depth", type=int, default=8, help="队列容量（与 InferencePool.max_pending 对应）")
+    args = parser.parse_args()
+
+    print(f"{'size':>10}{'mode':>7}{'fps':>10}{'MB/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'torn':>6}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split("x"))
+        for mode in ("queue", "ring"):
+            row = run(mode, (height, width, 3), args.frames, args.depth)
+            print(f"{size:>10}{mode:>7}{row['fps']:>10.1f}{row['mb_per_s']:>10.1f}"
+                  f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['torn']:>6}")
@@ -0,0 +1,68 @@
+# 各启动角色（APP_ROLE）的导入耗时与常驻内存：每个角色在全新的解释器中导入 app.main，
+# inference 角色额外统计启动时加载并预热模型的耗时；需要能连接到 app/utils/database.py 中配置的数据库
+# 用法: python etc/bench_startup.py --roles api inference all --repeat 3
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行：导入 app.main 并按角色执行启动钩子，输出一行 JSON
+CHILD = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app.main
+import_time = time.perf_counter() - start
+
+start = time.perf_counter()
+app.main.preload_models()
+preload_time = time.perf_counter() - start
+
+try:
+    import psutil
+    rss = psutil.Process().memory_info().rss
+except ImportError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+print(json.dumps({
+    "import_time": import_time,
+    "preload_time": preload_time,
+    "rss_mb": rss / 2 ** 20,
+    "heavy_modules": [m for m in ("torch", "ultralytics", "mediapipe", "scipy", "filterpy") if m in sys.modules],
+}))
+"""
+
+
+def measure(role):
+    env = dict(os.environ, APP_ROLE=role)
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--roles", nargs="+", default=["api", "inference", "all"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    report = {}
+    for role in args.roles:
+        runs = [measure(role) for _ in range(args.repeat)]
+        report[role] = {
+            "import_time": min(run["import_time"] for run in runs),
+            "preload_time": min(run["preload_time"] for run in runs),
+            "rss_mb": max(run["rss_mb"] for run in runs),
+            "heavy_modules": runs[-1]["heavy_modules"],
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'role':<12}{'import(s)':>10}{'preload(s)':>12}{'rss(MB)':>10}  heavy modules")
+        for role, row in report.items():
+            print(f"{role:<12}{row['import_time']:>10.3f}{row['preload_time']:>12.3f}{row['rss_mb']:>10.1f}  "
+                  f"{', '.join(row['heavy_modules']) or '-'}")
@@ -0,0 +1,127 @@
+# 对比 torch / onnx / openvino 后端（可选 INT8）的推理延迟与检测结果一致性
+# 用法: python -m etc.compare_backends --danger-model yolov8n.pt --face-model best_WIDER.pt --backends onnx onnx-int8
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.detection.danger_detection import DangerDetector
+from app.detection.frame_packet import FramePacket
+from app.detection.suffocation_detection import SuffocationDetector
+
+
+def box_iou(a, b):
+    xx1, yy1 = max(a[0], b[0]), max(a[1], b[1])
+    xx2, yy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, xx2 - xx1) * max(0, yy2 - yy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    # 以 torch 结果为基准做贪心匹配：类别相同且 IoU 达到阈值视为同一检测
+    matched, conf_diffs, used = 0, [], set()
+    for ref in reference:
+        best, best_iou = None, iou_threshold
+        for i, cand in enumerate(candidate):
+            if i in used or cand.get("cls_id") != ref.get("cls_id"):
+                continue
+            iou = box_iou(ref["bbox"], cand["bbox"])
+            if iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+            matched += 1
+            conf_diffs.append(abs(ref["confidence"] - candidate[best]["confidence"]))
+    return matched, conf_diffs
+
+
+def boxes_only(detections):
+    return [d for d in detections if d.get("bbox") is not None]
+
+
+def build_detector(kind, model_path, backend_spec):
+    backend, _, suffix = backend_spec.partition("-")
+    int8 = suffix == "int8"
+    cls = DangerDetector if kind == "danger" else SuffocationDetector
+    return cls(model_path, backend=backend, int8=int8)
+
+
+def run_backend(detector, packets, repeats):
+    latencies, outputs = [], []
+    for packet in packets:
+        detector.detect(packet)  # 预热
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = detector.detect(packet)
+            latencies.append((time.perf_counter() - start) * 1000)
+        outputs.append(boxes_only(result))
+    return latencies, outputs
+
+
+def compare(kind, model_path, backends, packets, repeats):
+    report = {}
+    reference = None
+    for backend_spec in ["torch"] + [b for b in backends if b != "torch"]:
+        detector = build_detector(kind, model_path, backend_spec)
+        latencies, outputs = run_backend(detector, packets, repeats)
+        entry = {
+            "latency_ms_mean": round(float(np.mean(latencies)), 2),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+            "detections": sum(len(o) for o in outputs),
+        }
+        if reference is None:
+            reference = outputs
+        else:
+            total_ref = sum(len(o) for o in reference)
+            total_cand = entry["detections"]
+            matched, conf_diffs = 0, []
+            for ref, cand in zip(reference, outputs):
+                m, diffs = match_detections(ref, cand)
+                matched += m
+                conf_diffs.extend(diffs)
+            entry["recall_vs_torch"] = round(matched / total_ref, 4) if total_ref else 1.0
+            entry["precision_vs_torch"] = round(matched / total_cand, 4) if total_cand else 1.0
+            entry["mean_conf_diff"] = round(float(np.mean(conf_diffs)), 4) if conf_diffs else 0.0
+            entry["speedup_vs_torch"] = round(report["torch"]["latency_ms_mean"] / entry["latency_ms_mean"], 2)
+        report[backend_spec] = entry
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--danger-model", default="yolov8n.pt")
+    parser.add_argument("--face-model", default="best_WIDER.pt")
+    parser.add_argument("--images", default=os.path.join(os.path.dirname(__file__), "test_picture"))
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8", "openvino"],
+                        help="torch 始终作为基准；可选 onnx、onnx-int8、openvino、openvino-int8")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default=None, help="JSON 报告输出路径")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.png")) + glob.glob(os.path.join(args.images, "*.jpg")))
+    packets = [FramePacket(cv2.imread(p)) for p in paths]
+
+    report = {
+        "images": len(packets),
+        "repeats": args.repeats,
+        "danger": compare("danger", args.danger_model, args.backends, packets, args.repeats),
+        "face": compare("face", args.face_model, args.backends, packets, args.repeats),
+    }
+
+    for kind in ("danger", "face"):
+        print(f"\n== {kind} ==")
+        print(f"{'backend':<16}{'mean(ms)':>10}{'p95(ms)':>10}{'speedup':>10}{'recall':>10}{'precision':>11}")
+        for backend, entry in report[kind].items():
+            print(f"{backend:<16}{entry['latency_ms_mean']:>10}{entry['latency_ms_p95']:>10}"
+                  f"{entry.get('speedup_vs_torch', 1.0):>10}{entry.get('recall_vs_torch', 1.0):>10}"
+                  f"{entry.get('precision_vs_torch', 1.0):>11}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,99 @@
+# WebSocket 告警广播压测：单进程内注册大量模拟连接（其中一部分是慢客户端），连续广播告警，
+# 统计每次广播的入队耗时、快客户端的发送延迟，以及慢客户端按溢出策略被丢弃 / 断开的情况；
+# --baseline 额外测量旧实现（逐个 await send_text）把一条消息发给所有连接的耗时
+# 用法: python etc/load_test_websocket.py --clients 10000 --slow-ratio 0.01 --messages 50
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api import websocket  # noqa: E402
+
+
+class FakeWebSocket:
+    # 模拟一个客户端连接，send_text 按给定延迟完成（模拟网络 / 移动端接收速度）
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+
+    async def send_text(self, payload):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+
+    async def close(self, code=1000):
+        pass
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] if ordered else 0.0
+
+
+async def run(args):
+    slow_count = int(args.clients * args.slow_ratio)
+    sockets = [FakeWebSocket(args.slow_delay if index < slow_count else args.fast_delay)
+               for index in range(args.clients)]
+
+    start = time.perf_counter()
+    for ws in sockets:
+        websocket.register_client(ws, max_queue=args.queue_size, policy=args.policy)
+    print(f"registered {args.clients} connections ({slow_count} slow) in {time.perf_counter() - start:.2f}s")
+
+    broadcast_times = []
+    for index in range(args.messages):
+        payload = json.dumps({"id": index, "level": "danger", "message": f"load test {index}"})
+        start = time.perf_counter()
+        websocket.broadcast(payload)
+        broadcast_times.append(time.perf_counter() - start)
+        await asyncio.sleep(args.interval)
+
+    # 等待快客户端把队列发完
+    fast = [websocket.connected_clients[ws] for ws in sockets[slow_count:] if ws in websocket.connected_clients]
+    deadline = time.perf_counter() + 30
+    while any(client.queue.qsize() for client in fast) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+    fast_lags = [client.max_lag * 1000 for client in fast]
+    slow_clients = [websocket.connected_clients.get(ws) for ws in sockets[:slow_count]]
+    slow_alive = [client for client in slow_clients if client is not None]
+    broadcast_ms = [t * 1000 for t in broadcast_times]
+
+    print(f"broadcast enqueue: p50 {percentile(broadcast_ms, 50):.2f} ms, "
+          f"p95 {percentile(broadcast_ms, 95):.2f} ms, max {max(broadcast_ms):.2f} ms")
+    print(f"fast clients: {len(fast)}, all {args.messages} received: "
+          f"{all(ws.received == args.messages for ws in sockets[slow_count:])}, "
+          f"max lag p50 {percentile(fast_lags, 50):.2f} ms, p95 {percentile(fast_lags, 95):.2f} ms, "
+          f"max {max(fast_lags, default=0):.2f} ms")
+    print(f"slow clients ({args.policy}): {len(slow_alive)} still connected, "
+          f"{sum(c.dropped for c in slow_alive)} messages dropped, {websocket.slow_disconnects} disconnected")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    for ws in list(websocket.connected_clients):
+        websocket.unregister_client(ws)
+
+    if args.baseline:
+        # 旧实现：逐个 await send_text，慢客户端阻塞其后所有连接
+        start = time.perf_counter()
+        for ws in sockets:
+            await ws.send_text("baseline")
+        print(f"baseline (sequential send_text): one message to all clients took {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--slow-ratio", type=float, default=0.01, help="慢客户端比例")
+    parser.add_argument("--fast-delay", type=float, default=0.0, help="快客户端每条消息的发送耗时（秒）")
+    parser.add_argument("--slow-delay", type=float, default=0.2, help="慢客户端每条消息的发送耗时（秒）")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.02, help="两次广播的间隔（秒）")
+    parser.add_argument("--queue-size", type=int, default=16, help="每个连接的发送队列容量")
+    parser.add_argument("--policy", choices=websocket.OVERFLOW_POLICIES, default="drop_oldest")
+    parser.add_argument("--baseline", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
@@ -0,0 +1,69 @@
+# NotificationWriter 批量写入测试：在 SQLite 上验证批内某一行写入失败时只有该行的 Future 失败，其余通知正常入库
+# 用法: python etc/test_notification_writer.py  或  python -m pytest etc/test_notification_writer.py
+import os
+import sys
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.utils.database 导入时会按 DATABASE_URL 建表，指向内存 SQLite，测试不依赖 MySQL 服务
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from app.models import Device, Notification, User  # noqa: E402
+from app.schemas import NotificationCreate  # noqa: E402
+from app.utils.database import Base  # noqa: E402
+from app.utils.notification_writer import NotificationWriter  # noqa: E402
+
+
+def make_session_factory():
+    # 内存库只有一个连接，写入线程与测试线程共用
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as session:
+        session.add(User(id=1, email="a@example.com", hashed_password="x", username="a"))
+        session.add(Device(id=1, name="cam", rtsp_url="rtsp://cam", ip="127.0.0.1", email="a@example.com"))
+        session.commit()
+    return session_factory
+
+
+def run_batch(strategy):
+    session_factory = make_session_factory()
+    writer = NotificationWriter(session_factory=session_factory, batch_size=6, flush_interval=0.5)
+    writer.strategy = strategy
+    writer.start()
+    # 第 3 条引用了不存在的设备，违反外键约束
+    device_ids = [1, 1, 999, 1, 1, 1]
+    futures = [writer.submit(NotificationCreate(device_id=device_id, level="danger", message=f"m{index}"), 1)
+               for index, device_id in enumerate(device_ids)]
+    writer.shutdown()
+
+    failed = [index for index, future in enumerate(futures) if future.exception(timeout=5) is not None]
+    assert failed == [2], failed
+    with session_factory() as session:
+        stored = {n.id: n.message for n in session.query(Notification).all()}
+    results = [futures[index].result() for index in range(len(futures)) if index != 2]
+    assert len(stored) == 5
+    assert all(stored[r["id"]] == r["message"] for r in results)
+    assert writer.stats()["written"] == 5 and writer.stats()["failed"] == 1
+
+
+def test_bad_row_only_fails_itself_returning():
+    run_batch(None)  # SQLite 支持 RETURNING
+
+
+def test_bad_row_only_fails_itself_per_row():
+    run_batch("per_row")
+
+
+if __name__ == "__main__":
+    test_bad_row_only_fails_itself_returning()
+    test_bad_row_only_fails_itself_per_row()
+    print("✅ NotificationWriter tests passed")